@@ -0,0 +1,152 @@
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+from pathlib import Path
+
+import pygame
+
+"""
+Precompiled image cache.
+The build step decodes and scales every image once and stores the pixels in display
+format, together with the collision masks, in a single file. At startup the loader
+reads that file in one go and rebuilds the surfaces with pygame.image.frombuffer,
+so no image has to be decoded or scaled again.
+
+Build it with:  python asset_cache.py [ASSETS_DIR]
+"""
+
+# Folder holding images/ and sounds/ when running from source
+ASSETS_DIR = Path(__file__).resolve().parent.parent
+
+CACHE_PATH = "images/assets.cache"
+MAGIC = b"FBCACHE1"
+PIXEL_FORMAT = "BGRA"  # Byte order of a 32 bit display surface on little endian machines
+
+
+def source_hash(path):
+    """Return the SHA-1 of a source image file."""
+    with open(path, "rb") as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+
+def cache_key(image_config, digest):
+    return f'{digest}:{image_config["width"]}x{image_config["height"]}'
+
+
+def platform_tag():
+    # Mask buffers are stored in native word size and byte order
+    return f"{struct.calcsize('P')}{sys.byteorder}"
+
+
+def load_source_image(path, image_config):
+    """Decode, scale and convert one image to the display format."""
+    image = pygame.image.load(path)
+    image = pygame.transform.scale(image, (image_config["width"], image_config["height"]))
+    if image.get_flags() & pygame.SRCALPHA:
+        return image.convert_alpha()
+    return image.convert()
+
+
+def build_cache(image_configs, resource_path, cache_path):
+    """Write every image of image_configs, and its mask, to one cache file.
+
+    resource_path maps a config path to a file path. A display mode must be set.
+    """
+    index = {"platform": platform_tag(), "images": {}}
+    chunks = []
+    offset = 0
+    for image_key, image_config in image_configs.items():
+        path = resource_path(image_config["path"])
+        image = load_source_image(path, image_config)
+        pixels = pygame.image.tobytes(image, PIXEL_FORMAT)
+        mask = pygame.mask.from_surface(image)
+        mask_bytes = memoryview(mask).cast("B").tobytes()
+
+        index["images"][image_key] = {
+            "key": cache_key(image_config, source_hash(path)),
+            "size": [image.get_width(), image.get_height()],
+            "alpha": bool(image.get_flags() & pygame.SRCALPHA),
+            "pixels": [offset, len(pixels)],
+            "mask": [offset + len(pixels), len(mask_bytes)],
+        }
+        chunks += [pixels, mask_bytes]
+        offset += len(pixels) + len(mask_bytes)
+
+    header = json.dumps(index).encode()
+    with open(cache_path, "wb") as file:
+        file.write(MAGIC)
+        file.write(struct.pack("<I", len(header)))
+        file.write(header)
+        for chunk in chunks:
+            file.write(chunk)
+
+
+def load_cache(image_configs, resource_path, cache_path):
+    """Rebuild the images and masks from the cache file.
+
+    Returns (images, masks), or None when the cache is missing or out of date.
+    """
+    try:
+        with open(cache_path, "rb") as file:
+            data = file.read()
+    except OSError:
+        return None
+    if data[:len(MAGIC)] != MAGIC:
+        return None
+    header_size = struct.unpack_from("<I", data, len(MAGIC))[0]
+    start = len(MAGIC) + 4
+    index = json.loads(data[start:start + header_size])
+    if index["platform"] != platform_tag():
+        return None
+
+    # Only use the cache when every source image is unchanged
+    entries = index["images"]
+    for image_key, image_config in image_configs.items():
+        if image_key not in entries:
+            return None
+        path = resource_path(image_config["path"])
+        if not os.path.exists(path) or entries[image_key]["key"] != cache_key(image_config, source_hash(path)):
+            return None
+
+    # Pixel format the display would give to a converted surface
+    display_masks = pygame.Surface((1, 1), pygame.SRCALPHA).convert_alpha().get_masks()
+
+    body = memoryview(data)[start + header_size:]
+    images = {}
+    masks = {}
+    for image_key in image_configs:
+        entry = entries[image_key]
+        pixel_offset, pixel_size = entry["pixels"]
+        image = pygame.image.frombuffer(body[pixel_offset:pixel_offset + pixel_size], entry["size"], PIXEL_FORMAT)
+        if not entry["alpha"]:
+            image = image.convert()
+        elif image.get_masks() != display_masks:
+            image = image.convert_alpha()
+        images[image_key] = image
+
+        mask_offset, mask_size = entry["mask"]
+        mask = pygame.mask.Mask(entry["size"])
+        memoryview(mask).cast("B")[:] = body[mask_offset:mask_offset + mask_size]
+        masks[image_key] = mask
+    return images, masks
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the precompiled image cache")
+    parser.add_argument("assets", nargs="?", default=str(ASSETS_DIR), help="folder holding images/ and sounds/")
+    args = parser.parse_args()
+
+    # Build the cache without showing a window or playing sound
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    assets = os.path.abspath(args.assets)
+    from main import Essentials
+
+    essentials = Essentials(application_path=assets)
+    essentials.loader.wait_all()
+    cache_path = essentials.get_resource_path(CACHE_PATH)
+    build_cache(essentials.image_configs, essentials.get_resource_path, cache_path)
+    print(f"Wrote {cache_path}")
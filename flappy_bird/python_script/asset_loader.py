@@ -0,0 +1,68 @@
+import sys
+import threading
+
+import pygame
+
+"""
+Background asset loading.
+Loading jobs are queued under a key and run in order on one background thread, so the
+window can show its first frame straight away. Images and masks live in AssetDicts:
+reading a key that is not loaded yet waits for just that job, so a screen only ever
+waits for the assets it actually uses. A failed job is fatal, like a missing image
+always was: the game exits the first time something waits on the loader after it.
+"""
+
+
+class AssetDict(dict):
+    """A dict whose missing keys are waited for on the loader instead of raising KeyError."""
+
+    def __init__(self, loader):
+        super().__init__()
+        self.loader = loader
+
+    def __missing__(self, key):
+        self.loader.wait(key)
+        return dict.__getitem__(self, key)
+
+
+class AssetLoader:
+    def __init__(self):
+        self.jobs = []
+        self.finished = {}  # Key -> Event set once its job ran
+        self.error = None
+        self.thread = None
+
+    def add(self, key, job):
+        """Queue job() to run on the loader thread. Jobs run in the order they were added."""
+        self.jobs.append((key, job))
+        self.finished[key] = threading.Event()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        for key, job in self.jobs:
+            try:
+                job()
+            except Exception as e:
+                # Wake every waiter so the main thread sees the failure
+                self.error = e
+                for finished in self.finished.values():
+                    finished.set()
+                return
+            self.finished[key].set()
+
+    def wait(self, key):
+        """Block until the job of key ran, pumping events so the window stays responsive."""
+        finished = self.finished.get(key)
+        if finished is None:
+            raise KeyError(key)
+        while not finished.wait(0.02):
+            pygame.event.pump()
+        if self.error is not None:
+            sys.exit()
+
+    def wait_all(self):
+        for key in self.finished:
+            self.wait(key)
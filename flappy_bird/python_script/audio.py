@@ -0,0 +1,87 @@
+import os
+import threading
+
+import pygame
+
+"""
+Audio manager.
+Background music is streamed with pygame.mixer.music and restarted from its
+end-of-track event, so nothing has to poll. Sound effects are loaded once and played
+on channels reserved for each effect, which also limits how many copies of one
+effect can play at the same time. The mixer can be initialized after the manager is
+created, for example on a loader thread; until load() ran every call is a no-op, and
+music asked for in the meantime starts as soon as it has.
+"""
+
+MUSIC_END = pygame.USEREVENT + 1  # Posted by the mixer when the music track finishes
+
+
+class AudioManager:
+    def __init__(self, effects, music_path=None, voices=2):
+        """effects maps an effect name to its sound file. Each effect gets voices channels."""
+        self.effects = effects
+        self.voices = voices
+        self.music_path = music_path
+        self.music_playing = False
+        self.music_wanted = False
+        self.sounds = {}
+        self.channels = {}
+        self.next_voice = {}
+        self.enabled = False
+        self.lock = threading.RLock()  # load() starts wanted music while holding it
+        self.load()
+
+    def load(self):
+        """Load the effects once the mixer is initialized. Without an audio device every call stays a no-op."""
+        if self.enabled or pygame.mixer.get_init() is None:
+            return
+
+        # Reserve voices channels per effect so music and other effects never steal them
+        reserved = self.voices * len(self.effects)
+        pygame.mixer.set_num_channels(max(pygame.mixer.get_num_channels(), reserved + 2))
+        pygame.mixer.set_reserved(reserved)
+        for index, (name, path) in enumerate(self.effects.items()):
+            self.sounds[name] = pygame.mixer.Sound(path)
+            self.channels[name] = [pygame.mixer.Channel(index * self.voices + voice) for voice in range(self.voices)]
+            self.next_voice[name] = 0
+        with self.lock:
+            self.enabled = True
+            if self.music_wanted:
+                self.start_music()
+
+    def play(self, name):
+        """Play an effect on a free channel of its own, or replace its oldest voice."""
+        if not self.enabled:
+            return
+        channels = self.channels[name]
+        for channel in channels:
+            if not channel.get_busy():
+                break
+        else:
+            channel = channels[self.next_voice[name]]
+            self.next_voice[name] = (self.next_voice[name] + 1) % len(channels)
+        channel.play(self.sounds[name])
+
+    def start_music(self):
+        """Start streaming the music, if it is not playing yet and the file exists."""
+        with self.lock:
+            self.music_wanted = True
+            if not self.enabled or self.music_playing or not self.music_path or not os.path.exists(self.music_path):
+                return False
+            pygame.mixer.music.load(self.music_path)
+            pygame.mixer.music.set_endevent(MUSIC_END)
+            pygame.mixer.music.play()
+            self.music_playing = True
+            return True
+
+    def handle_event(self, event):
+        """Restart the music when its track ends."""
+        if event.type == MUSIC_END and self.music_playing:
+            pygame.mixer.music.play()
+
+    def stop(self):
+        if not self.enabled:
+            return
+        self.music_playing = False
+        pygame.mixer.music.stop()
+        pygame.mixer.stop()
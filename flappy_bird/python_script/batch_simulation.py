@@ -0,0 +1,204 @@
+import numpy as np
+import pygame
+
+from collision import mask_bounds
+from rotation_cache import RotationCache
+from simulation import IMAGES_DIR, load_headless_images
+
+"""
+Vectorized version of the simulation core that steps many independent games at once.
+Every piece of game state is a NumPy array with one entry per game, so one step
+costs a handful of array operations no matter how many birds are flying.
+Collisions use the tight bounding boxes of the bird and pipe masks.
+"""
+
+
+class BatchSimulation:
+    def __init__(self, num_games, bird_image, pipe_image, screen_width=1400, screen_height=850,
+                 gravity=0.4, jump_strength=-9, gap_height=250, pipe_speed=5, auto_reset=True):
+        self.num_games = num_games
+        self.screen_width = screen_width
+        self.screen_height = screen_height
+        self.auto_reset = auto_reset  # Restart finished games on the next step
+
+        # Game constants, the same as in Simulation
+        self.gravity = gravity
+        self.jump_strength = jump_strength
+        self.gap_height = gap_height
+        self.pipe_speed = pipe_speed
+        self.pipe_interval = 90
+        self.jump_cooldown_ticks = 10
+        self.bird_x = 50
+        self.padding = 20
+        self.max_up_angle = 30
+        self.max_down_angle = -20
+        self.rotation_speed = 2
+
+        # Collision boxes taken from the masks the single game uses, one bird box per rotated frame
+        frames = RotationCache(bird_image, self.max_down_angle, self.max_up_angle, self.rotation_speed)
+        self.bird_angles = np.array(sorted(frames.frames))
+        self.bird_boxes = np.array([self.frame_box(frames.frames[angle]) for angle in self.bird_angles])
+        self.pipe_width = pipe_image.get_width()
+        self.pipe_height = pipe_image.get_height()
+        self.bottom_box = mask_bounds(pygame.mask.from_surface(pipe_image))
+        self.top_box = mask_bounds(pygame.mask.from_surface(pygame.transform.flip(pipe_image, False, True)))
+
+        # Enough pipe slots per game to hold every pipe that can be on screen at once
+        travel_ticks = (screen_width + self.pipe_width) / pipe_speed
+        self.max_pipes = int(np.ceil(travel_ticks / self.pipe_interval)) + 1
+
+        # Per game state
+        self.flappy_y = np.zeros(num_games)
+        self.flappy_velocity = np.zeros(num_games)
+        self.flappy_angle = np.zeros(num_games)
+        self.jump_cooldown = np.zeros(num_games, dtype=np.int32)
+        self.score = np.zeros(num_games, dtype=np.int64)
+        self.tick = np.zeros(num_games, dtype=np.int64)
+        self.last_pipe_tick = np.zeros(num_games, dtype=np.int64)
+        self.pipe_count = np.zeros(num_games, dtype=np.int64)
+        self.done = np.zeros(num_games, dtype=bool)
+        self.final_score = np.zeros(num_games, dtype=np.int64)  # Score of the last finished game
+
+        # Per pipe state, one row per game and one column per pipe slot
+        self.pipe_x = np.zeros((num_games, self.max_pipes))
+        self.pipe_top = np.zeros((num_games, self.max_pipes))
+        self.pipe_active = np.zeros((num_games, self.max_pipes), dtype=bool)
+
+        self.reset()
+
+    @staticmethod
+    def frame_box(frame):
+        """Return the mask box of a rotated frame, relative to the unrotated image."""
+        _, mask, (offset_x, offset_y) = frame
+        x, y, width, height = mask_bounds(mask)
+        return x + offset_x, y + offset_y, width, height
+
+    @classmethod
+    def headless(cls, num_games, images_dir=IMAGES_DIR, **kwargs):
+        """Build a batch from the image files, without a display."""
+        bird_image, pipe_image = load_headless_images(images_dir)
+        return cls(num_games, bird_image, pipe_image, **kwargs)
+
+    def reset(self, seed=None):
+        """Start every game from scratch. The same seed always produces the same courses."""
+        self.rng = np.random.default_rng(seed)
+        self.reset_games(np.ones(self.num_games, dtype=bool))
+        return self.observation()
+
+    def reset_games(self, which):
+        """Start a new game for every game selected by the boolean array which."""
+        self.flappy_y[which] = self.screen_height // 2
+        self.flappy_velocity[which] = 0
+        self.flappy_angle[which] = 0
+        self.jump_cooldown[which] = 0
+        self.score[which] = 0
+        self.tick[which] = 0
+        self.last_pipe_tick[which] = -self.pipe_interval  # Spawn the first pipe straight away
+        self.pipe_count[which] = 0
+        self.done[which] = False
+        self.pipe_active[which] = False
+
+    def step(self, actions):
+        """Advance every game by one tick. actions is a boolean array. Returns (rewards, dones)."""
+        if self.auto_reset and self.done.any():
+            self.reset_games(self.done)
+        alive = ~self.done
+        score_before = self.score.copy()
+
+        # Jump where asked and the cooldown allows it
+        jumping = alive & np.asarray(actions, dtype=bool) & (self.jump_cooldown <= 0)
+        self.flappy_velocity[jumping] = self.jump_strength
+        self.jump_cooldown[jumping] = self.jump_cooldown_ticks
+
+        self.generate_pipes(alive)
+        self.apply_physics(alive)
+        self.update_pipes(alive)
+        self.check_collisions(alive)
+
+        self.tick[alive] += 1
+        finished = alive & self.done
+        self.final_score[finished] = self.score[finished]
+        return self.score - score_before, self.done.copy()
+
+    def generate_pipes(self, alive):
+        spawning = alive & (self.tick - self.last_pipe_tick >= self.pipe_interval)
+        rows = np.flatnonzero(spawning)
+        if rows.size == 0:
+            return
+        slots = self.pipe_count[rows] % self.max_pipes
+        self.pipe_x[rows, slots] = self.screen_width
+        self.pipe_top[rows, slots] = self.rng.integers(150, 451, size=rows.size)
+        self.pipe_active[rows, slots] = True
+        self.pipe_count[rows] += 1
+        self.last_pipe_tick[rows] = self.tick[rows]
+
+    def apply_physics(self, alive):
+        # Apply gravity and update the birds' positions
+        self.flappy_velocity[alive] += self.gravity
+        self.flappy_y[alive] += self.flappy_velocity[alive]
+
+        # Move every angle towards its target by at most rotation_speed
+        target = np.where(self.flappy_velocity < 0, self.max_up_angle, self.max_down_angle)
+        angle = np.clip(target, self.flappy_angle - self.rotation_speed, self.flappy_angle + self.rotation_speed)
+        self.flappy_angle[alive] = angle[alive]
+
+        # Birds that leave the screen with padding are done
+        out = (self.flappy_y > self.screen_height - self.padding) | (self.flappy_y < self.padding)
+        self.done |= alive & out
+
+        cooling = alive & (self.jump_cooldown > 0)
+        self.jump_cooldown[cooling] -= 1
+
+    def update_pipes(self, alive):
+        moving = self.pipe_active & alive[:, None]
+        self.pipe_x[moving] -= self.pipe_speed
+
+        # Free the slots of pipes that are off the screen
+        self.pipe_active &= self.pipe_x + self.pipe_width >= 0
+
+    def check_collisions(self, alive):
+        checking = alive & ~self.done
+        # Look up the box of the frame matching each bird's angle
+        frame = np.clip(np.rint((self.flappy_angle - self.bird_angles[0]) / self.rotation_speed), 0, len(self.bird_angles) - 1).astype(int)
+        bird_x, bird_y, bird_w, bird_h = self.bird_boxes[frame].T
+        bird_left = (self.bird_x + bird_x)[:, None]
+        bird_w = bird_w[:, None]
+        bird_top = (self.flappy_y + bird_y)[:, None]
+        bird_bottom = bird_top + bird_h[:, None]
+
+        # Top pipe box, drawn so its bottom edge sits at pipe_top
+        top_x, top_y, top_w, top_h = self.top_box
+        top_pipe_bottom = self.pipe_top - self.pipe_height + top_y + top_h
+        top_hit = ((self.pipe_x + top_x < bird_left + bird_w) & (self.pipe_x + top_x + top_w > bird_left)
+                   & (bird_top < top_pipe_bottom))
+
+        # Bottom pipe box, drawn with its top edge at pipe_top + gap_height
+        bottom_x, bottom_y, bottom_w, _ = self.bottom_box
+        bottom_pipe_top = self.pipe_top + self.gap_height + bottom_y
+        bottom_hit = ((self.pipe_x + bottom_x < bird_left + bird_w) & (self.pipe_x + bottom_x + bottom_w > bird_left)
+                      & (bird_bottom > bottom_pipe_top))
+
+        hit = ((top_hit | bottom_hit) & self.pipe_active).any(axis=1)
+        self.done |= checking & hit
+
+        # Pipes that crossed the bird's x position this tick score a point
+        crossed = (self.pipe_x <= self.bird_x) & (self.pipe_x + self.pipe_speed > self.bird_x)
+        passed = (self.pipe_active & crossed).sum(axis=1)
+        scoring = checking & ~hit
+        self.score[scoring] += passed[scoring]
+
+    def observation(self):
+        """Return an (num_games, 5) array laid out like Simulation.observation()."""
+        upcoming = self.pipe_active & (self.pipe_x + self.pipe_width >= self.bird_x)
+        distance = np.where(upcoming, self.pipe_x, np.inf)
+        nearest = distance.argmin(axis=1)
+        has_pipe = upcoming.any(axis=1)
+        rows = np.arange(self.num_games)
+
+        observation = np.empty((self.num_games, 5))
+        observation[:, 0] = self.flappy_y
+        observation[:, 1] = self.flappy_velocity
+        observation[:, 2] = np.where(has_pipe, self.pipe_x[rows, nearest] - self.bird_x, self.screen_width - self.bird_x)
+        observation[:, 3] = np.where(has_pipe, self.pipe_top[rows, nearest], 0)
+        observation[:, 4] = np.where(has_pipe, self.pipe_top[rows, nearest] + self.gap_height, self.screen_height)
+        return observation
@@ -0,0 +1,228 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from array import array
+from pathlib import Path
+
+"""
+Benchmarks for the game's hot paths.
+Everything runs under SDL's dummy video and audio drivers, so no window or sound device
+is needed. Results are written as JSON; given a baseline file from an earlier run, every
+benchmark whose fastest run got slower than the allowed threshold is reported and the
+exit status is 1, so the suite can gate changes. A baseline file can also carry its own
+thresholds for single benchmarks as {"thresholds": {"mask_overlap": 0.5}}:
+
+    python benchmark.py --output bench.json
+    python benchmark.py --baseline bench.json --threshold 0.25
+"""
+
+# Where the images, sounds and font live when running from source
+ASSETS_DIR = Path(__file__).resolve().parent.parent
+HISTORY_SIZES = (10_000, 100_000, 1_000_000)
+
+
+def measure(function, number, repeat):
+    """Call function number times per run, repeat runs, and return per-call times in microseconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        times.append((time.perf_counter() - start) / number * 1e6)
+    return {
+        "median_us": statistics.median(times),
+        "min_us": min(times),
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def write_history(path, size):
+    """Write a score log with size records without going through append()."""
+    from score_log import LOG_MAGIC
+    scores = array("I", (index * 7919 % 200 for index in range(size)))
+    if sys.byteorder != "little":
+        scores.byteswap()
+    with open(path, "wb") as file:
+        file.write(LOG_MAGIC)
+        file.write(scores.tobytes())
+
+
+def run_benchmarks(quick=False):
+    from ghosts import GhostRace
+    from main import Essentials, FlappyBirdGame
+    from multiplayer import encode_players
+    from scenes import StatsScene
+    from replay import Replay
+    from score_log import ScoreLog
+    from simulation import Pipe
+    import pygame
+
+    scale = 0.1 if quick else 1
+    repeat = 3 if quick else 7
+
+    def times(number):
+        return max(1, int(number * scale))
+
+    results = {}
+    application_path = str(ASSETS_DIR)
+    directory = tempfile.TemporaryDirectory()
+
+    results["essentials_init"] = measure(lambda: Essentials(application_path=application_path).loader.wait_all(), 1, repeat)
+    essentials = Essentials(application_path=application_path)
+    essentials.loader.wait_all()
+    results["load_images"] = measure(essentials.load_images, times(10), repeat)
+
+    game = FlappyBirdGame(application_path=application_path, score_path=os.path.join(directory.name, "scores.log"))
+    game.reset_game(seed=1)
+    images = game.simulation.pipe_images
+    screen = game.essentials.screen
+
+    results["pipe_construct"] = measure(lambda: Pipe(images, 1400, 250), times(20000), repeat)
+    pipe = Pipe(images, 700, 250)
+    results["pipe_draw"] = measure(lambda: pipe.draw(screen), times(5000), repeat)
+
+    # Bird frame against a pipe it touches, so overlap has to scan pixels
+    _, bird_mask, (offset_x, offset_y) = game.bird_frames.frame(0)
+    pipe.x = 100
+    (mask_top, top_pos), (mask_bottom, bottom_pos) = pipe.get_masks()
+    bird_pos = (50 + offset_x, pipe.bottom_y - 60 + offset_y)
+
+    def overlap():
+        bird_mask.overlap(mask_top, (int(top_pos[0] - bird_pos[0]), int(top_pos[1] - bird_pos[1])))
+        bird_mask.overlap(mask_bottom, (int(bottom_pos[0] - bird_pos[0]), int(bottom_pos[1] - bird_pos[1])))
+    results["mask_overlap"] = measure(overlap, times(20000), repeat)
+
+    # A game frame with the pipes of a running game on screen
+    for _ in range(400):
+        game.simulation.step(game.simulation.tick % 25 == 0)
+    game.sync_state()
+
+    simulation = game.simulation
+    bird = simulation.collider.bird(simulation.bird_x, simulation.flappy_y, simulation.flappy_angle)
+
+    def collide():
+        for live_pipe in simulation.pipes:
+            simulation.collider.hits(bird, live_pipe)
+    results["collide_live_pipes"] = measure(collide, times(20000), repeat)
+
+    def game_frame():
+        game.draw(game=True)
+        game.essentials.present()
+    results["draw_game_frame"] = measure(game_frame, times(300), repeat)
+
+    game.home_layer = game.build_home_layer()
+
+    def home_frame():
+        game.draw(game=False)
+        game.home_layer.draw(screen)
+        game.essentials.present()
+    results["home_frame"] = measure(home_frame, times(300), repeat)
+
+    # 500 ghosts mid-race, each jumping on its own rhythm
+    replays = [Replay(1, simulation.gravity, simulation.jump_strength, simulation.gap_height, simulation.pipe_speed,
+                      list(range(index % 25, 600, 40 + index % 10)), 0, 600) for index in range(500)]
+    ghosts = GhostRace(replays, simulation, game.bird_frames)
+    results["draw_500_ghosts"] = measure(lambda: ghosts.draw(screen, 300, 0.5), times(300), repeat)
+
+    # One tick of snapshots for a full 16 player race, against the previous tick
+    states = {player_id: (1700 + player_id * 8, -20, 3, 1) for player_id in range(16)}
+    baseline = {player_id: (1690 + player_id * 8, -20, 3, 1) for player_id in range(16)}
+
+    def encode_snapshots():
+        for player_id in range(16):
+            others = {other: state for other, state in states.items() if other != player_id}
+            encode_players(others, baseline)
+    results["encode_16_snapshots"] = measure(encode_snapshots, times(2000), repeat)
+
+    # Score persistence against histories of growing size
+    game.score_log.close()
+    for size in HISTORY_SIZES:
+        log_path = os.path.join(directory.name, f"scores_{size}.log")
+        index_path = os.path.join(directory.name, f"scores_{size}.idx")
+        write_history(log_path, size)
+        ScoreLog(log_path, index_path, legacy_path=None).close()  # Build the index once
+
+        def open_log():
+            ScoreLog(log_path, index_path, legacy_path=None).close()
+        results[f"score_log_open_{size}"] = measure(open_log, times(200), repeat)
+
+        game.score_log = ScoreLog(log_path, index_path, legacy_path=None)
+        game.score = 42
+        results[f"end_game_persist_{size}"] = measure(game.record_score, times(2000), repeat)
+
+        # Leaderboard frames scrolling a few pixels at a time, new rows come into view
+        leaderboard = StatsScene(game)
+        leaderboard.enter()
+
+        def leaderboard_frame():
+            leaderboard.offset = leaderboard.target = (leaderboard.offset + 7) % max(leaderboard.max_offset, 1)
+            leaderboard.dirty = True
+            leaderboard.draw()
+        results[f"leaderboard_scroll_{size}"] = measure(leaderboard_frame, times(500), repeat)
+        game.score_log.close()
+
+    pygame.quit()
+    directory.cleanup()
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Return [(name, baseline time, current time)] for every benchmark slower than allowed."""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            continue
+        # The fastest run is the least disturbed by the rest of the machine
+        allowed = baseline.get("thresholds", {}).get(name, threshold)
+        if result["min_us"] > previous["min_us"] * (1 + allowed):
+            regressions.append((name, previous["min_us"], result["min_us"]))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the game's hot paths headless")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against the results of an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown, 0.25 is 25%%")
+    parser.add_argument("--quick", action="store_true", help="fewer iterations, for a fast sanity check")
+    args = parser.parse_args()
+
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+
+    import pygame
+    results = run_benchmarks(args.quick)
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "platform": platform.platform(),
+            "quick": args.quick,
+        },
+        "results": results,
+    }
+    for name, result in results.items():
+        print(f"{name:<28} {result['median_us']:12.2f} us")
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        report["regressions"] = [{"name": name, "baseline_us": before, "current_us": after}
+                                 for name, before, after in regressions]
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: {before:.2f} us -> {after:.2f} us")
+        status = 1 if regressions else 0
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    sys.exit(status)
@@ -0,0 +1,176 @@
+import multiprocessing
+import os
+import queue
+import shutil
+import subprocess
+from multiprocessing import shared_memory
+
+import pygame
+
+"""
+Gameplay video capture.
+Every presented frame is copied straight from the display's pixel buffer into one slot
+of a ring of preallocated shared memory frames, and its slot number is queued for an
+encoder process. The encoders write a PNG sequence, a raw video file or pipe into
+ffmpeg when it is installed, off the game's process, so encoding never holds the
+game's GIL. When every slot is still waiting to be encoded the frame is dropped
+instead of stalling the game. Frames keep their presented number, so a drop leaves a
+gap in the PNG names and repeats the previous frame in a video, which then lasts as
+long as the game ran.
+"""
+
+FFMPEG_PIXEL_FORMATS = {"BGRA": "bgr0", "RGBA": "rgb0"}
+
+
+def encoder(block_name, frame_size, size, pixel_format, output_format, directory, fps, filled, free):
+    """Encode the frames queued in filled, handing every slot back through free."""
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    if hasattr(os, "nice"):
+        os.nice(10)  # The game gets the CPU first, frames are dropped if the encoders fall behind
+    block = shared_memory.SharedMemory(name=block_name)
+
+    if output_format == "ffmpeg":
+        width, height = size
+        ffmpeg = subprocess.Popen(
+            ["ffmpeg", "-loglevel", "error", "-y", "-f", "rawvideo", "-pix_fmt", FFMPEG_PIXEL_FORMATS[pixel_format],
+             "-s", f"{width}x{height}", "-r", str(fps), "-i", "-", "-pix_fmt", "yuv420p",
+             os.path.join(directory, "capture.mp4")],
+            stdin=subprocess.PIPE)
+        output = ffmpeg.stdin
+    elif output_format == "raw":
+        output = open(os.path.join(directory, "capture.raw"), "wb")
+
+    def write_stream(slot, until):
+        """Repeat the frame in slot up to frame number until, over any frames that were dropped."""
+        frame = block.buf[slot * frame_size:(slot + 1) * frame_size]
+        for _ in range(until - written):
+            output.write(frame)
+        frame.release()
+
+    written = 0  # Frames in the video stream so far
+    held = None  # Slot of the newest streamed frame, kept until the next one to fill a gap with it
+    while True:
+        slot, number = filled.get()
+        if slot is None:
+            # number is the count of presented frames, pad up to it so the video lasts as long as the game ran
+            if held is not None:
+                write_stream(held, number)
+                free.put(held)
+            break
+        if output_format == "png":
+            # Files are named by presented frame, so a dropped frame leaves a gap in the numbers
+            frame = block.buf[slot * frame_size:(slot + 1) * frame_size]
+            image = pygame.image.frombuffer(frame, size, pixel_format)
+            image.fill((0, 0, 0, 255), special_flags=pygame.BLEND_RGBA_MAX)  # The display's padding byte is not alpha
+            pygame.image.save(image, os.path.join(directory, f"frame_{number:06d}.png"))
+            del image
+            frame.release()
+            free.put(slot)
+            continue
+        if held is not None:
+            write_stream(held, number)  # The previous frame stays on screen while frames are dropped
+            written = number
+            free.put(held)
+        write_stream(slot, number + 1)
+        written = number + 1
+        held = slot
+
+    if output_format != "png":
+        output.close()
+    if output_format == "ffmpeg":
+        ffmpeg.wait()
+    block.close()
+
+
+class FrameCapture:
+    def __init__(self, surface, directory, fps=60, output_format="auto", slots=8, workers=None):
+        """Capture frames shaped like surface into directory.
+
+        output_format is "ffmpeg", "png", "raw", or "auto" for ffmpeg when it is installed
+        and PNG files otherwise.
+        """
+        if output_format == "auto":
+            output_format = "ffmpeg" if shutil.which("ffmpeg") else "png"
+        elif output_format == "ffmpeg" and not shutil.which("ffmpeg"):
+            print("ffmpeg was not found, capturing PNG files instead")
+            output_format = "png"
+        self.output_format = output_format
+        self.directory = directory
+        self.fps = fps
+        os.makedirs(directory, exist_ok=True)
+
+        # Copy the display's own bytes when they are 32 bit RGB in either order without padding
+        self.size = surface.get_size()
+        width, height = self.size
+        shifts = surface.get_shifts()[:3]
+        self.direct = surface.get_bytesize() == 4 and surface.get_pitch() == width * 4 and shifts in ((16, 8, 0), (0, 8, 16))
+        self.pixel_format = "BGRA" if self.direct and shifts == (16, 8, 0) else "RGBA"
+
+        # Ring of frames in one shared block, free slots and filled slots travel through queues
+        self.frame_size = width * height * 4
+        self.block = shared_memory.SharedMemory(create=True, size=self.frame_size * slots)
+        # Spawn rather than fork, forking while the asset loader thread holds a lock can deadlock the child
+        context = multiprocessing.get_context("spawn")
+        self.free = context.Queue()
+        self.filled = context.Queue()
+        for slot in range(slots):
+            self.free.put(slot)
+
+        # PNG frames are independent files and can be encoded in parallel, leaving a core to the game
+        if output_format == "png":
+            workers = workers or max(1, min(4, (os.cpu_count() or 2) - 1))
+        else:
+            workers = 1
+        self.processes = []
+        for _ in range(workers):
+            process = context.Process(target=encoder, daemon=True, args=(
+                self.block.name, self.frame_size, self.size, self.pixel_format, output_format, directory, fps,
+                self.filled, self.free))
+            process.start()
+            self.processes.append(process)
+
+        self.frames = 0
+        self.dropped = 0
+        self.closed = False
+
+    def capture(self, surface):
+        """Queue a copy of surface for encoding. Returns False when the frame had to be dropped."""
+        number = self.frames  # Frames are numbered as presented, a dropped one leaves a gap
+        self.frames += 1
+        try:
+            slot = self.free.get_nowait()
+        except queue.Empty:
+            self.dropped += 1
+            return False
+        frame = self.block.buf[slot * self.frame_size:(slot + 1) * self.frame_size]
+        if self.direct:
+            frame[:] = surface.get_view("0")
+        else:
+            frame[:] = pygame.image.tobytes(surface, "RGBA")
+        frame.release()
+        self.filled.put((slot, number))
+        return True
+
+    def close(self):
+        """Wait for the queued frames to be encoded and release the ring."""
+        if self.closed:
+            return
+        self.closed = True
+        for _ in self.processes:
+            self.filled.put((None, self.frames))
+        for process in self.processes:
+            process.join()
+        self.block.close()
+        self.block.unlink()
+
+        print(f"Captured {self.frames - self.dropped} of {self.frames} frames to {self.directory}, dropped {self.dropped}")
+        if self.output_format == "raw":
+            width, height = self.size
+            print(f"Convert with: ffmpeg -f rawvideo -pix_fmt {FFMPEG_PIXEL_FORMATS[self.pixel_format]} "
+                  f"-s {width}x{height} -r {self.fps} -i capture.raw capture.mp4")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,66 @@
+"""
+Bird against pipe collision in three phases.
+The broad phase compares the columns covered by the bird's and the pipe's opaque pixels,
+so pipes away from the bird cost two comparisons. The gap test then accepts a bird that
+sits entirely inside the gap. Only when the bird's box reaches into a pipe's box does
+the pixel perfect mask overlap run, and only against that pipe half.
+"""
+
+
+def mask_bounds(mask):
+    """Return the tight (x, y, width, height) box around the set pixels of a mask."""
+    rects = mask.get_bounding_rects()
+    if not rects:
+        return 0, 0, 0, 0
+    box = rects[0].unionall(rects[1:])
+    return box.x, box.y, box.width, box.height
+
+
+class Collider:
+    def __init__(self, bird_frames, pipe_images):
+        self.bird_frames = bird_frames
+        self.pipe_images = pipe_images
+
+        # Opaque box of every rotated bird frame, relative to where the frame is drawn
+        self.bird_boxes = {angle: mask_bounds(mask) for angle, (_, mask, _) in bird_frames.frames.items()}
+
+        # Opaque columns of the pipe, and the rows where each half's pixels end
+        top_x, top_y, top_width, top_height = mask_bounds(pipe_images.mask_top)
+        bottom_x, bottom_y, bottom_width, _ = mask_bounds(pipe_images.mask_bottom)
+        self.pipe_left = min(top_x, bottom_x)
+        self.pipe_right = max(top_x + top_width, bottom_x + bottom_width)
+        self.top_solid_end = top_y + top_height - pipe_images.height  # Relative to the top of the gap
+        self.bottom_solid_start = bottom_y  # Relative to the bottom of the gap
+
+    def bird(self, x, y, angle):
+        """Return (mask, left, top, box) for the bird drawn at (x, y) with the given angle.
+
+        box is (left, top, right, bottom) of its opaque pixels, one pixel taller on each
+        side so rounding the mask offsets can never make the box test miss a hit.
+        """
+        key = self.bird_frames.key(angle)
+        _, mask, (offset_x, offset_y) = self.bird_frames.frames[key]
+        box_x, box_y, width, height = self.bird_boxes[key]
+        left = x + offset_x
+        top = y + offset_y
+        return mask, left, top, (left + box_x, top + box_y - 1, left + box_x + width, top + box_y + height + 1)
+
+    def hits(self, bird, pipe):
+        """Return True when the bird from bird() touches either half of the pipe."""
+        mask, left, top, (box_left, box_top, box_right, box_bottom) = bird
+
+        # Broad phase, the pipe is not in the bird's columns
+        if pipe.x + self.pipe_left >= box_right or pipe.x + self.pipe_right <= box_left:
+            return False
+
+        # Gap test, the bird is clear of both halves
+        top_solid_end = pipe.top_height + self.top_solid_end
+        bottom_solid_start = pipe.bottom_y + self.bottom_solid_start
+        if box_top >= top_solid_end and box_bottom <= bottom_solid_start:
+            return False
+
+        # Narrow phase, pixel perfect against the half the box reaches into
+        images = self.pipe_images
+        if box_top < top_solid_end and mask.overlap(images.mask_top, (pipe.x - left, int(pipe.top_height - images.height - top))):
+            return True
+        return box_bottom > bottom_solid_start and mask.overlap(images.mask_bottom, (pipe.x - left, int(pipe.bottom_y - top))) is not None
@@ -0,0 +1,110 @@
+import os
+from array import array
+from collections import Counter
+
+import pygame
+
+from replay import Replay
+
+"""
+Ghost races against earlier runs.
+Every ghost's flight is computed once from its replay before the race: the bird's
+height and angle after every tick. The ghost sprites are the rotated bird frames, faded
+and cropped to their visible pixels, so drawing hundreds of ghosts is one batched blits
+call over small surfaces with no rotation or scaling while playing.
+"""
+
+
+def load_replays(directory):
+    """Load every replay file in directory."""
+    replays = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".fbr"):
+            try:
+                replays.append(Replay.load(os.path.join(directory, name)))
+            except (OSError, ValueError) as e:
+                print(f"Skipping replay '{name}': {e}")
+    return replays
+
+
+class BirdSprites:
+    """Faded bird frames cropped to their visible pixels, drawn many at a time in one blits call."""
+
+    def __init__(self, bird_frames, bird_x, opacity=90):
+        self.key = bird_frames.key
+        self.bird_x = bird_x
+        self.frames = self.build_frames(bird_frames, opacity)
+        self.blit_sequence = []  # Reused every frame
+
+    @staticmethod
+    def build_frames(bird_frames, opacity):
+        """Return {angle: (faded surface, offset)} cropped to the visible pixels of each frame."""
+        frames = {}
+        for angle, (rotated, _, (offset_x, offset_y)) in bird_frames.frames.items():
+            faded = rotated.copy()
+            faded.fill((255, 255, 255, opacity), special_flags=pygame.BLEND_RGBA_MULT)
+            visible = faded.get_bounding_rect()
+            frames[angle] = (faded.subsurface(visible).copy(), (offset_x + visible.x, offset_y + visible.y))
+        return frames
+
+    def draw(self, screen, birds):
+        """Draw a bird at every (y, angle) in birds. Returns how many were drawn."""
+        frames = self.frames
+        key = self.key
+        bird_x = self.bird_x
+        blit_sequence = self.blit_sequence
+        blit_sequence.clear()
+        for y, angle in birds:
+            surface, (offset_x, offset_y) = frames[key(angle)]
+            blit_sequence.append((surface, (bird_x + offset_x, y + offset_y)))
+        screen.blits(blit_sequence, doreturn=False)
+        return len(blit_sequence)
+
+
+class GhostRace:
+    def __init__(self, replays, simulation, bird_frames, opacity=90):
+        # Race on the course, and with the constants, that most replays were recorded with
+        def course(replay):
+            return replay.seed, tuple(sorted(replay.constants().items()))
+        counts = Counter(course(replay) for replay in replays)
+        chosen = counts.most_common(1)[0][0] if counts else None
+        self.replays = [replay for replay in replays if course(replay) == chosen]
+        self.seed = self.replays[0].seed if self.replays else None
+
+        self.sprites = BirdSprites(bird_frames, simulation.bird_x, opacity)
+        self.flights = [self.record_flight(replay, simulation) for replay in self.replays]
+
+    def __len__(self):
+        return len(self.flights)
+
+    def apply_constants(self, simulation):
+        """Give simulation the constants the ghosts flew with."""
+        self.replays[0].apply_constants(simulation)
+
+    @staticmethod
+    def record_flight(replay, simulation):
+        """Return (heights, angles) after every tick of the replay, starting with the initial state.
+
+        Only the bird is simulated: its flight never depends on the pipes, and the
+        replay already knows the tick on which the run ended.
+        """
+        replay.apply_constants(simulation)
+        simulation.reset(replay.seed)
+        actions = replay.actions()
+        heights = array("f", [simulation.flappy_y])
+        angles = array("f", [simulation.flappy_angle])
+        for tick in range(replay.final_tick):
+            if tick in actions:
+                simulation.jump()
+            simulation.apply_physics()
+            heights.append(simulation.flappy_y)
+            angles.append(simulation.flappy_angle)
+        return heights, angles
+
+    def draw(self, screen, tick, alpha=1.0):
+        """Draw every ghost still flying at tick, alpha of the way from the previous tick."""
+        previous = max(tick - 1, 0)
+        return self.sprites.draw(screen, (
+            (heights[previous] + (heights[tick] - heights[previous]) * alpha,
+             angles[previous] + (angles[tick] - angles[previous]) * alpha)
+            for heights, angles in self.flights if tick < len(heights)))
@@ -0,0 +1,93 @@
+import time
+from array import array
+from collections import deque
+
+import pygame
+
+"""
+Low-latency input.
+Events are drained from SDL whenever the game would otherwise sleep, about once a
+millisecond while waiting for the next frame, and every jump press is stamped with the
+time it was drained. The play loop asks for the presses made before the end of each
+fixed tick, so a press lands on the tick it belongs to however many ticks a frame runs,
+and its latency is measured until the first frame that shows it is presented.
+"""
+
+
+class InputQueue:
+    def __init__(self, jump_keys=(pygame.K_SPACE,), history=1000):
+        self.jump_keys = jump_keys
+        self.events = []  # Drained events the scenes have not seen yet
+        self.presses = deque(maxlen=64)  # Times of jump presses no tick has used yet
+        self.applied = []  # Times of presses used by a tick that is not on screen yet
+
+        # Press to present latencies in seconds, a ring of the last history presses
+        self.history = history
+        self.latencies = array("d", bytes(8 * history))
+        self.latency_count = 0
+
+    def drain(self):
+        """Move SDL's pending events to the queue, stamping the jump presses."""
+        events = pygame.event.get()
+        if not events:
+            return
+        now = time.perf_counter()
+        for event in events:
+            if event.type == pygame.KEYDOWN and event.key in self.jump_keys:
+                self.presses.append(now)
+        self.events.extend(events)
+
+    def take_events(self):
+        """Return every event drained so far, oldest first."""
+        self.drain()
+        events = self.events
+        self.events = []
+        return events
+
+    def wait_events(self):
+        """Sleep until at least one event arrives and return every pending event."""
+        if not self.events:
+            event = pygame.event.wait()
+            if event.type == pygame.KEYDOWN and event.key in self.jump_keys:
+                self.presses.append(time.perf_counter())
+            self.events.append(event)
+        return self.take_events()
+
+    def wait_until(self, deadline):
+        """Sleep until the perf_counter() deadline, draining events about every millisecond."""
+        while True:
+            self.drain()
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, 0.001))
+
+    def clear(self):
+        """Forget presses made before now, such as the ones on a menu."""
+        self.drain()
+        self.presses.clear()
+        self.applied.clear()
+
+    def jump_due(self, tick_end):
+        """Return True when a jump was pressed before tick_end, the wall time the tick ends at."""
+        presses = self.presses
+        due = False
+        while presses and presses[0] < tick_end:
+            self.applied.append(presses.popleft())
+            due = True
+        return due
+
+    def presented(self, when):
+        """Record the latency of every applied press, now that a frame showing it is on screen."""
+        for pressed in self.applied:
+            self.latencies[self.latency_count % self.history] = when - pressed
+            self.latency_count += 1
+        self.applied.clear()
+
+    def latency_percentiles(self, percents=(50, 95, 99)):
+        """Return {percent: ms} over the recorded presses, empty before the first one."""
+        count = min(self.latency_count, self.history)
+        if not count:
+            return {}
+        latencies = sorted(self.latencies[:count])
+        return {percent: latencies[min(count - 1, count * percent // 100)] * 1000 for percent in percents}
@@ -1,57 +1,58 @@
-import threading
+import argparse
 import pygame
 import random
 import sys
+import time
 from pathlib import Path
 import os
+import asset_cache
+from asset_loader import AssetDict, AssetLoader
+from audio import AudioManager
+from capture import FrameCapture
+from ghosts import GhostRace, load_replays
+from input_queue import InputQueue
+from menu_layer import StaticLayer
+from profiler import FrameProfiler
+from replay import Replay
+from render_target import QualityController, RenderTarget
+from rotation_cache import RotationCache
+from multiplayer import DEFAULT_PORT
+from scenes import CountdownScene, HomeScene, RaceScene
+from score_log import ScoreLog
+from simulation import Simulation
+from stats_store import StatsStore
+from text_cache import NumberRenderer, TextCache
 
 """
 This game is a remake of the flappy bird game!
 It allows the user to play the game, view their stats and return to the home screen.
 """
 
-class Pipe:
-    def __init__(self, image, x, gap_height):
-        self.image = image
-        self.x = x
-        self.gap_height = gap_height
-        self.top_height = random.randint(150, 450)  # Random height for the top pipe
-
-        # Bottom pipe's position is below the gap
-        self.bottom_y = self.top_height + self.gap_height
-
-        # Create masks for collision detection
-        self.mask_top = pygame.mask.from_surface(pygame.transform.flip(self.image, False, True))
-        self.mask_bottom = pygame.mask.from_surface(self.image)
-
-    def draw(self, screen):
-        # Draw the top pipe (flipped vertically)
-        top_pipe = pygame.transform.flip(self.image, False, True)
-        screen.blit(top_pipe, (self.x, self.top_height - self.image.get_height()))
-        
-        # Draw the bottom pipe
-        screen.blit(self.image, (self.x, self.bottom_y))
-
-    def update(self, speed):
-        self.x -= speed
-
-    def is_off_screen(self):
-        return self.x + self.image.get_width() < 0
-
-    def get_masks(self):
-        top_pipe_pos = (self.x, self.top_height - self.image.get_height())
-        bottom_pipe_pos = (self.x, self.bottom_y)
-        return (self.mask_top, top_pipe_pos), (self.mask_bottom, bottom_pipe_pos)
-
 class Essentials:
-    def __init__(self):
-        pygame.init()
+    def __init__(self, render_scale=1.0, adaptive_quality=True, max_fps=60, profile=False, trace_path="frame_trace.json",
+                 application_path=None):
+        # Only the modules the game uses, the mixer is initialized on the loader thread
+        pygame.display.init()
+        pygame.font.init()
         self.running = True
         self.screen_width = 1400
         self.screen_height = 850
-        self.screen = pygame.display.set_mode((self.screen_width, self.screen_height))
+        self.display = pygame.display.set_mode((self.screen_width, self.screen_height))
+
+        # Everything is drawn in 1400x850 logical coordinates, possibly at a lower internal resolution
+        self.screen = RenderTarget(self.display, (self.screen_width, self.screen_height), render_scale)
+        self.quality = QualityController(self.screen, enabled=adaptive_quality)
+        self.capture = None  # FrameCapture that records every presented frame, when capturing
+        self.input = InputQueue()  # Timestamped events, drained while waiting for the next frame
         pygame.display.set_caption("Flappy Bird")
-        self.font = pygame.font.Font("images/minecraftia/Minecraftia-Regular.ttf", 50)
+
+        # Handle paths dynamically based on if the app is frozen or running from source
+        self.application_path = application_path or self.get_application_path()
+
+        # Fonts are loaded once and rendered text is cached
+        self.text = TextCache(str(self.get_resource_path("images/minecraftia/Minecraftia-Regular.ttf")))
+        self.font = self.text.font(50)
+        self.show_loading_screen()
 
         # Set up image and sound paths relative to the application's path
         self.image_configs = {
@@ -62,30 +63,40 @@ class Essentials:
             "next": {"path":  "images/next.png", "width": 400, "height": 400}
         }
 
+        # Background music is streamed, the effects are loaded once
+        self.music_path = "sounds/background.wav"
         self.wavs = {
-            "background":  "sounds/background.wav",
             "jump":  "sounds/jump.wav",
             "click":  "sounds/button_click.wav"
         }
 
-        # Handle paths dynamically based on if the app is frozen or running from source
-        self.application_path = self.get_application_path()
-
-        self.images = {}
+        # Images and masks fill in from the loader, reading one that is not there yet waits for it
+        self.loader = AssetLoader()
+        self.images = AssetDict(self.loader)
+        self.masks = AssetDict(self.loader)
 
         # Initialize other game properties
         self.flappy_y = self.screen_height // 2
         self.flappy_angle = 0  # Initialize the angle of the bird
         self.bg_x = 0
-        self.bg_speed = 0.5
+        self.bg_speed = 0.5  # Pixels per simulation tick
+        self.bg_time = time.perf_counter()  # When the background last moved
         self.gravity = 0.4  # Gravity value for smooth fall
         self.jump_strength = -9  # Strength of the jump
         self.flappy_velocity = 0  # Velocity of the bird
         self.button = pygame.Rect(self.screen_width // 2 - 100, self.screen_height // 2 + 100, 200, 100)  # Center the button and set its dimensions
-        self.clock = pygame.time.Clock()
+        self.tick_rate = 60  # Simulation ticks per second, fixed
+        self.max_fps = max_fps  # Rendering frame cap, 0 for uncapped
+        self.max_catch_up_ticks = 5  # Most ticks simulated in one frame before dropping time
+        self.max_frame_time = 0.25  # Longest stall, in seconds, that the simulation catches up on
+        self.restart_frame_timing()  # next_frame is when the next frame is due under max_fps
+
+        # Phase timings, F3 toggles the overlay and F4 writes a Chrome trace
+        self.profiler = FrameProfiler(enabled=profile)
+        self.trace_path = trace_path
 
-        self.load_images()
         self.load_sounds()
+        self.start_loading()
 
     def get_application_path(self):
         """Helper function to determine the correct application path depending on whether the app is frozen or not."""
@@ -101,85 +112,211 @@ class Essentials:
         base_path = Path(self.application_path)
         return base_path / path
 
+    def show_loading_screen(self):
+        """Put something on screen before any asset is loaded."""
+        self.screen.fill((0, 0, 0))
+        loading = self.text.render("Loading...")
+        self.screen.blit(loading, loading.get_rect(center=(self.screen_width // 2, self.screen_height // 2)))
+        self.present()
+        pygame.event.pump()
+
+    def start_loading(self):
+        """Load the images and sounds on the loader thread, the ones the first screens need first."""
+        self.loader.add("cache", self.load_cached_images)
+        for image_key in self.image_configs:
+            self.loader.add(image_key, lambda image_key=image_key: self.load_image(image_key))
+        self.loader.add("audio", self.init_audio)
+        self.loader.start()
+
     def load_images(self):
-        """Load all images dynamically from the image_configs dictionary."""
-        for image_key, image_config in self.image_configs.items():
-            # Load the image using the specified path
-            image_path = self.get_resource_path(image_config["path"])
-            try:
-                image = pygame.image.load(image_path)
-            except pygame.error as e:
-                print(f"Error loading image '{image_path}': {e}")
-
-                # Handle the error, e.g., exit the program or display an error message
-                sys.exit()
-            image = pygame.transform.scale(image, (image_config["width"], image_config["height"]))
-
-            # Store the processed image in the self.images dictionary
-            self.images[image_key] = image
+        """Load all images dynamically from the image_configs dictionary, without the loader thread."""
+        self.images = {}
+        self.masks = {}
+        if not self.load_cached_images():
+            for image_key in self.image_configs:
+                try:
+                    self.load_image(image_key)
+                except (pygame.error, FileNotFoundError):
+                    sys.exit()
+
+    def load_cached_images(self):
+        """Take every image from the precompiled cache when it is up to date. Returns True if it was."""
+        cached = asset_cache.load_cache(self.image_configs, self.get_resource_path, self.get_resource_path(asset_cache.CACHE_PATH))
+        if cached is None:
+            return False
+        images, masks = cached
+        self.masks.update(masks)
+        self.images.update(images)
+        return True
+
+    def load_image(self, image_key):
+        """Load, scale and convert one image and build its mask, unless the cache provided it."""
+        if image_key in self.images:
+            return
+        image_config = self.image_configs[image_key]
+        # Load the image using the specified path
+        image_path = self.get_resource_path(image_config["path"])
+        try:
+            image = asset_cache.load_source_image(image_path, image_config)
+        except (pygame.error, FileNotFoundError) as e:
+            print(f"Error loading image '{image_path}': {e}")
+            raise
+
+        # Store the mask first, the image is what waiting readers look for
+        self.masks[image_key] = pygame.mask.from_surface(image)
+        self.images[image_key] = image
+
+    def init_audio(self):
+        """Initialize the mixer and load the sounds. Without an audio device the game stays silent."""
+        try:
+            pygame.mixer.init()
+        except pygame.error:
+            return
+        self.audio.load()
+
+    def present(self, rects=None):
+        """Show what was drawn this frame."""
+        self.screen.present(rects)
+        self.input.presented(time.perf_counter())
+        if self.capture is not None:
+            self.capture.capture(self.display)
+
+    def end_frame(self):
+        """Show the frame, wait for the next one and let the quality controller adapt."""
+        self.profiler.draw_overlay(self.screen, self.text)
+        self.profiler.mark("draw")
+        self.present()
+        self.profiler.mark("flip")
+        work_ms = (time.perf_counter() - self.frame_started) * 1000
+
+        # Wait for the next frame draining input, rather than sleeping through presses
+        if self.max_fps:
+            self.next_frame = max(self.next_frame + 1 / self.max_fps, time.perf_counter())
+            self.input.wait_until(self.next_frame)
+        self.quality.update(work_ms)
+        self.frame_started = time.perf_counter()
+        self.profiler.mark("tick wait")
+        self.profiler.end_frame()
 
     def load_sounds(self):
-        """Load sound files."""
-        for key, path in self.wavs.items():
-            sound_path = self.get_resource_path(path)
-            self.wavs[key] = pygame.mixer.Sound(sound_path)
+        """Prepare the sound effects and the music stream, they load once the mixer is up."""
+        effects = {key: self.get_resource_path(path) for key, path in self.wavs.items()}
+        self.audio = AudioManager(effects, self.get_resource_path(self.music_path))
+
+    def poll_events(self):
+        """Return the pending events, after letting the audio manager see them."""
+        events = self.input.take_events()
+        for event in events:
+            self.audio.handle_event(event)
+            self.handle_profiler_key(event)
+        return events
+
+    def handle_profiler_key(self, event):
+        if event.type != pygame.KEYDOWN:
+            return
+        if event.key == pygame.K_F3:
+            self.profiler.toggle_overlay()
+        elif event.key == pygame.K_F4 and self.profiler.enabled:
+            self.profiler.export_chrome_trace(self.trace_path)
+            print(f"Wrote frame trace to {self.trace_path}")
+
+    def restart_frame_timing(self):
+        """Start frame pacing and work timing afresh, so time spent idle never counts as a frame."""
+        self.next_frame = self.frame_started = time.perf_counter()
+
+    def wait_events(self):
+        """Sleep until something happens, then return the pending events."""
+        events = self.input.wait_events()
+        self.restart_frame_timing()
+        for event in events:
+            self.audio.handle_event(event)
+            self.handle_profiler_key(event)
+        return events
             
 class FlappyBirdGame:
-    def __init__(self):
-        self.essentials = Essentials()
-        self.pipes = []
-        self.pipe_interval = 1500  # Time interval between pipe generations in milliseconds
-        self.last_pipe_time = pygame.time.get_ticks()
-        self.gap_height = 250  # Gap between top and bottom pipes
-        self.pipe_speed = 5  # Speed at which pipes move left
-        self.jump_cooldown = 0  # Cooldown timer to control jump frequency
+    def __init__(self, stats_path=None, max_fps=60, replay_dir=None, profile=False, trace_path="frame_trace.json",
+                 application_path=None, score_path="scores.log", ghost_dir=None, capture_dir=None, capture_format="auto",
+                 render_scale=1.0, adaptive_quality=True):
+        self.essentials = Essentials(render_scale=render_scale, adaptive_quality=adaptive_quality, max_fps=max_fps,
+                                     profile=profile, trace_path=trace_path, application_path=application_path)
+        # Every rotated bird frame is built once and shared by drawing and collision
+        self.bird_frames = RotationCache(self.essentials.images["flappy_bird"])
+
+        # The game rules live in the headless simulation, the game only renders it
+        self.simulation = Simulation(
+            self.essentials.images["flappy_bird"], self.essentials.images["pipes"],
+            screen_width=self.essentials.screen_width, screen_height=self.essentials.screen_height,
+            gravity=self.essentials.gravity, jump_strength=self.essentials.jump_strength,
+            bird_frames=self.bird_frames, pipe_mask=self.essentials.masks["pipes"])
+        self.simulation.profiler = self.essentials.profiler
+        # Replays, ghosts and races bring their own constants, normal games go back to these
+        self.default_constants = {key: getattr(self.simulation, key) for key in ("gravity", "jump_strength", "gap_height", "pipe_speed")}
+        self.pipes = self.simulation.pipes
         self.score = 0
-        # Create mask for the bird
-        self.bird_mask = pygame.mask.from_surface(self.essentials.images["flappy_bird"])
+        self.score_log = ScoreLog(score_path, os.path.splitext(score_path)[0] + ".idx")
+        self.stats_store = StatsStore(stats_path) if stats_path else None  # Optional per-run analytics
+        self.run_started = time.perf_counter()
+        self.render_alpha = 1.0
+        self.replay_dir = replay_dir  # Save a replay of every finished run here when set
+        self.recording = None
+        self.score_renderer = NumberRenderer(self.essentials.text, "Score: ")
         self.next_arrow = pygame.Rect(1000, 800, 100, 100)
         self.return_button = pygame.Rect(self.essentials.screen_width // 2 - 250, 800, 500, 100)
-        pygame.mixer.init()  # Initialize the mixer
-        self.music = True
-        threading.Thread(target=self.home_async).start()
-
-    def home_async(self):
-        # Load the sound only once
-        background_sound = pygame.mixer.Sound(self.essentials.wavs["background"])
-
-        # Main loop for playing the sound
-        while self.music:
-            # Check if the sound is still playing
-            if not pygame.mixer.get_busy():
-                background_sound.play()
-            # Adding a slight delay to prevent busy waiting
-            pygame.time.delay(100)
-
-
-    def reset_game(self):
-        # Reset bird position and angle
-        self.essentials.flappy_y = self.essentials.screen_height // 2
-        self.essentials.flappy_angle = 0
-        self.essentials.gravity = 0.4
-        # Reset score
-        self.score = 0
-
-        # Reset pipes
-        self.pipes = []
+        self.home_layer = None  # Static menu layers, composited the first time they are shown
+        self.delete_layer = None
+
+        # Record gameplay video without slowing the game down
+        if capture_dir:
+            self.essentials.capture = FrameCapture(self.essentials.display, capture_dir, fps=max_fps or 60, output_format=capture_format)
+
+        # Race against the replays in ghost_dir, on the course they were recorded on
+        self.ghosts = None
+        if ghost_dir:
+            self.ghosts = GhostRace(load_replays(ghost_dir), self.simulation, self.bird_frames)
+            if not len(self.ghosts):
+                print(f"No replays to race against in '{ghost_dir}'")
+                self.ghosts = None
+        self.rivals = None  # multiplayer.Client of a LAN race, drawing the other players
+
+    def reset_game(self, seed=None):
+        # Start a new simulated game with a known seed and copy its state over
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        self.simulation.reset(seed)
+        self.sync_state()
+        self.run_started = time.perf_counter()
 
         # Reset any other relevant game state variables
         self.essentials.bg_x = 0
-        self.essentials.running = True  
-        self.flappy_velocity = 0
-
-    def delete_data(self):
-        # Clear the screen by filling it with a background color
-        self.essentials.screen.fill((0, 0, 0))  # Fill with black color or any other background color
+        self.essentials.running = True
+
+    def restore_constants(self):
+        """Give the simulation back the game's own constants."""
+        for key, value in self.default_constants.items():
+            setattr(self.simulation, key, value)
+
+    def sync_state(self, alpha=1.0):
+        """Copy the simulation state to the attributes used for drawing.
+
+        alpha blends between the previous tick (0) and the latest one (1).
+        """
+        simulation = self.simulation
+        self.render_alpha = alpha
+        self.essentials.flappy_y = simulation.previous_flappy_y + (simulation.flappy_y - simulation.previous_flappy_y) * alpha
+        self.essentials.flappy_angle = simulation.previous_flappy_angle + (simulation.flappy_angle - simulation.previous_flappy_angle) * alpha
+        self.essentials.flappy_velocity = self.simulation.flappy_velocity
+        self.pipes = self.simulation.pipes
+        self.score = self.simulation.score
+
+    def build_delete_layer(self):
+        """Composite the delete confirmation screen once."""
+        layer = StaticLayer(self.essentials.screen.get_size(), fill=(0, 0, 0))
 
         # Render warning texts
-        warning_text = self.essentials.font.render("This will delete all of your data", True, (255, 255, 255))
-        warning_text2 = self.essentials.font.render("Are you sure?", True, (255, 255, 255))
-        delete_text = self.essentials.font.render("Delete", True, (255, 255, 255))
-        home_text = self.essentials.font.render("Home", True, (255, 255, 255))
+        warning_text = self.essentials.text.render("This will delete all of your data")
+        warning_text2 = self.essentials.text.render("Are you sure?")
+        delete_text = self.essentials.text.render("Delete")
+        home_text = self.essentials.text.render("Home")
 
         # Define button images
         button_img = self.essentials.images["try_again_button"]
@@ -194,411 +331,182 @@ class FlappyBirdGame:
         button_y = (self.essentials.screen_height // 2) + 100
 
         # Define buttons
-        self.essentials.delete_button = pygame.Rect(delete_button_x, button_y, button_width, button_height)
-        self.essentials.home_button = pygame.Rect(home_button_x, button_y, button_width, button_height)
-
-        # Get text rectangles
-        warning_text_rect = warning_text.get_rect(center=(self.essentials.screen_width // 2, self.essentials.screen_height // 2))
-        warning_text2_rect = warning_text2.get_rect(center=(self.essentials.screen_width // 2, self.essentials.screen_height // 2 + 50))
-        delete_text_rect = delete_text.get_rect(center=self.essentials.delete_button.center)
-        home_text_rect = home_text.get_rect(center=self.essentials.home_button.center)
-
-        # Blit elements to the screen
-        self.essentials.screen.blit(button_img, self.essentials.delete_button.topleft)
-        self.essentials.screen.blit(button_img, self.essentials.home_button.topleft)
-        self.essentials.screen.blit(warning_text, warning_text_rect)
-        self.essentials.screen.blit(warning_text2, warning_text2_rect)
-        self.essentials.screen.blit(delete_text, delete_text_rect)
-        self.essentials.screen.blit(home_text, home_text_rect)
-
-        while True:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    self.music = False
-                    pygame.quit()
-                    sys.exit()
-                elif event.type == pygame.MOUSEBUTTONDOWN:
-                    pygame.mixer.Sound(self.essentials.wavs["click"]).play()
-                    if self.essentials.delete_button.collidepoint(event.pos):
-                        # Delete the stats file
-                        try:
-                            with open("scores.txt", "w") as file:
-                                file.write("")
-                        except FileNotFoundError:
-                            os.mkdir("scores.txt")
-                        return  # Exit the function after deleting the file
-                    elif self.essentials.home_button.collidepoint(event.pos):
-                        return  # Exit the function to return to the home screen
-
-            pygame.display.flip()
-            self.essentials.clock.tick(60)
-
-    def show_stats(self):
-        self.essentials.screen.fill((0, 0, 0))  # Clear the screen
-        try:
-            with open("scores.txt", "r") as file:
-                # Read all lines, strip whitespace, and sort in reverse order
-                stats = sorted([line.strip() for line in file.readlines()], reverse=True)
-        except FileNotFoundError:
-            os.mkdir("scores.txt")
-            stats = []
-
-        if not stats:
-            no_stats_text = self.essentials.font.render("No stats available", True, (255, 255, 255))
-            return_text = self.essentials.font.render("Return", True, (255, 255, 255))
-            self.essentials.screen.blit(no_stats_text, (50, 50))
-
-            button_img = self.essentials.images["try_again_button"]
-            button_rect = button_img.get_rect(center=self.essentials.button.center)
-            return_text_rect = return_text.get_rect(center=button_rect.center)
-
-            self.essentials.screen.blit(button_img, button_rect.topleft)
-            self.essentials.screen.blit(return_text, return_text_rect)
-            while True:
-                for event in pygame.event.get():
-                    if event.type == pygame.QUIT:
-                        pygame.quit()
-                        sys.exit()
-                    elif event.type == pygame.MOUSEBUTTONDOWN:
-                        pygame.mixer.Sound(self.essentials.wavs["click"]).play()
-                        mouse_pos = pygame.mouse.get_pos()
-                        if self.essentials.button.collidepoint(mouse_pos):
-                            self.home()
-                pygame.display.flip()
-                self.essentials.clock.tick(60)
-
-        current_index = 0
-        limit = len(stats)
+        self.confirm_delete_button = pygame.Rect(delete_button_x, button_y, button_width, button_height)
+        self.cancel_delete_button = pygame.Rect(home_button_x, button_y, button_width, button_height)
+
+        # Composite elements onto the layer
+        layer.add(button_img, self.confirm_delete_button.topleft)
+        layer.add(button_img, self.cancel_delete_button.topleft)
+        layer.add_centered(warning_text, (self.essentials.screen_width // 2, self.essentials.screen_height // 2))
+        layer.add_centered(warning_text2, (self.essentials.screen_width // 2, self.essentials.screen_height // 2 + 50))
+        layer.add_centered(delete_text, self.confirm_delete_button.center)
+        layer.add_centered(home_text, self.cancel_delete_button.center)
+        return layer
+
+    def build_home_layer(self):
+        """Composite the title, bird and buttons of the home screen once."""
+        layer = StaticLayer(self.essentials.screen.get_size())
+
+        # Scale the bird image and give it a 45-degree upward tilt
+        scaled_bird = pygame.transform.scale(self.essentials.images["flappy_bird"], (800, 800))
+        rotated_bird = pygame.transform.rotate(scaled_bird, 45)
+        bird_x = self.essentials.screen_width // 2 - rotated_bird.get_width() // 2
+        bird_y = (self.essentials.screen_height // 2 - rotated_bird.get_height()) // 2 - 80
+        title = self.essentials.text.render("Flappy Bird", 100)
+        layer.add(title, (self.essentials.screen_width // 2 - 325, self.essentials.screen_height // 2 - 100))
+        layer.add(rotated_bird, (bird_x, bird_y))
 
         try_again_button = self.essentials.images["try_again_button"]
-        next_arrow = self.essentials.images["next"]
-        back_arrow = pygame.transform.rotate(next_arrow, 180)
-
-        button_x = self.essentials.screen_width // 2 - try_again_button.get_width() // 2
-        button_y = self.essentials.screen_height // 2 + 100
-        self.essentials.button = pygame.Rect(button_x, button_y, try_again_button.get_width(), try_again_button.get_height())
-
-        next_arrow_x = self.essentials.screen_width - next_arrow.get_width() - 50
-        next_arrow_y = self.essentials.screen_height - next_arrow.get_height() - 50
-        next_arrow_rect = pygame.Rect(next_arrow_x, next_arrow_y, next_arrow.get_width(), next_arrow.get_height())
-
-        back_arrow_x = 50
-        back_arrow_y = self.essentials.screen_height - back_arrow.get_height() - 50
-        back_arrow_rect = pygame.Rect(back_arrow_x, back_arrow_y, back_arrow.get_width(), back_arrow.get_height())
-
-        return_text = self.essentials.font.render("Return", True, (255, 255, 255))
-        next_text = self.essentials.font.render("Next Stat", True, (255, 255, 255))
-        prev_text = self.essentials.font.render("Previous Stat", True, (255, 255, 255))
-        return_text_rect = return_text.get_rect(center=self.essentials.button.center)
-
-        self.essentials.screen.blit(try_again_button, (button_x, button_y))
-        self.essentials.screen.blit(return_text, return_text_rect)
-        if current_index < limit - 1:
-            self.essentials.screen.blit(next_text, (next_arrow_x, next_arrow_y + 100))
-            self.essentials.screen.blit(next_arrow, (next_arrow_x, next_arrow_y))
-        if current_index > 0:
-            self.essentials.screen.blit(prev_text, (back_arrow_x, back_arrow_y + 100))
-            self.essentials.screen.blit(back_arrow, (back_arrow_x, back_arrow_y))
+        play_button_x = (self.essentials.screen_width // 2 - try_again_button.get_width() // 2) + 400
+        play_button_y = (self.essentials.screen_height // 2) + 200
 
-        while True:
-            self.essentials.screen.fill((0, 0, 0))  # Clear the screen
-            stats_text = self.essentials.font.render(f"Stats {current_index + 1}/{limit}", True, (255, 255, 255))
-            score_text = self.essentials.font.render(f"Score: {stats[current_index].strip()}", True, (255, 255, 255))
-            self.essentials.screen.blit(stats_text, (50, 50))
-            self.essentials.screen.blit(score_text, (50, 150))
-
-            self.essentials.screen.blit(try_again_button, (self.essentials.button.x, self.essentials.button.y))
-            self.essentials.screen.blit(return_text, return_text_rect)
-            if current_index < limit - 1:
-                self.essentials.screen.blit(next_arrow, (next_arrow_x, next_arrow_y))
-                next_text = self.essentials.font.render("Next", True, (255, 255, 255))
-                next_text_rect = next_text.get_rect(center=(next_arrow_x + next_arrow.get_width() // 2, next_arrow_y - 20))
-                self.essentials.screen.blit(next_text, next_text_rect)
-            if current_index > 0:
-                self.essentials.screen.blit(back_arrow, (back_arrow_x, back_arrow_y))
-                prev_text = self.essentials.font.render("Previous", True, (255, 255, 255))
-                prev_text_rect = prev_text.get_rect(center=(back_arrow_x + back_arrow.get_width() // 2, back_arrow_y - 20))
-                self.essentials.screen.blit(prev_text, prev_text_rect)
-
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
-                elif event.type == pygame.MOUSEBUTTONDOWN:
-                    pygame.mixer.Sound(self.essentials.wavs["click"]).play()
-                    mouse_pos = pygame.mouse.get_pos()
-                    if self.essentials.button.collidepoint(mouse_pos):
-                        self.home()
-                    elif next_arrow_rect.collidepoint(mouse_pos) and current_index < limit - 1:
-                        current_index += 1
-                    elif back_arrow_rect.collidepoint(mouse_pos) and current_index > 0:
-                        current_index -= 1
-
-            pygame.display.flip()
-            self.essentials.clock.tick(60)
-    
-    def home(self):
-        scaled_font = pygame.font.Font("images/minecraftia/Minecraftia-Regular.ttf", 100)
-        while self.essentials.running:
-            self.draw(game=False)
-            # Scale the bird image
-            scaled_bird = pygame.transform.scale(self.essentials.images["flappy_bird"], (800, 800))
-
-            # Draw the bird with a 45-degree upward tilt
-            rotated_bird = pygame.transform.rotate(scaled_bird, 45)
-            bird_x = self.essentials.screen_width // 2 - rotated_bird.get_width() // 2
-            bird_y = (self.essentials.screen_height // 2 - rotated_bird.get_height()) // 2 - 80
-            title = scaled_font.render("Flappy Bird", True, (255, 255, 255))
-            self.essentials.screen.blit(title, (self.essentials.screen_width // 2 - 325, self.essentials.screen_height // 2 - 100))
-            self.essentials.screen.blit(rotated_bird, (bird_x, bird_y))
-
-            try_again_button = self.essentials.images["try_again_button"]
-            play_button_x = (self.essentials.screen_width // 2 - try_again_button.get_width() // 2) + 400
-            play_button_y = (self.essentials.screen_height // 2) + 200
-
-            stats_button_x = (self.essentials.screen_width // 2 - try_again_button.get_width() // 2) - 400
-            stats_button_y = (self.essentials.screen_height // 2) + 200
-
-            delete_button_x = (self.essentials.screen_width // 2 - try_again_button.get_width() // 2)
-            delete_button_y = (self.essentials.screen_height // 2)
-
-            # Define buttons
-            self.essentials.run_button = pygame.Rect(play_button_x, play_button_y, try_again_button.get_width(), try_again_button.get_height())
-            self.essentials.stats_button = pygame.Rect(stats_button_x, stats_button_y, try_again_button.get_width(), try_again_button.get_height())
-            self.essentials.delete_button = pygame.Rect(delete_button_x, delete_button_y, try_again_button.get_width(), try_again_button.get_height())
-
-            # Blit buttons
-            self.essentials.screen.blit(try_again_button, (play_button_x, play_button_y))
-            self.essentials.screen.blit(try_again_button, (stats_button_x, stats_button_y))
-            self.essentials.screen.blit(try_again_button, (delete_button_x, delete_button_y))
-
-            # Render text
-            play_text = self.essentials.font.render("Play", True, (255, 255, 255))
-            stats_text = self.essentials.font.render("Stats", True, (255, 255, 255))
-            delete_text = self.essentials.font.render("Delete Stats", True, (255, 255, 255))
-
-            # Center text on buttons
-            play_text_rect = play_text.get_rect(center=self.essentials.run_button.center)
-            stats_text_rect = stats_text.get_rect(center=self.essentials.stats_button.center)
-            delete_text_rect = delete_text.get_rect(center=self.essentials.delete_button.center)
-
-            # Blit text
-            self.essentials.screen.blit(play_text, play_text_rect)
-            self.essentials.screen.blit(stats_text, stats_text_rect)
-            self.essentials.screen.blit(delete_text, delete_text_rect)
-
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    self.essentials.running = False
-                    pygame.quit()
-                    sys.exit()
-                elif event.type == pygame.MOUSEBUTTONDOWN:
-                    if event.button == 1:  # Left mouse button
-                        pygame.mixer.Sound(self.essentials.wavs["click"]).play()
-                        mouse_pos = pygame.mouse.get_pos()
-                        if self.essentials.run_button.collidepoint(mouse_pos):
-                            self.reset_game()
-                            self.run()
-                        elif self.essentials.stats_button.collidepoint(mouse_pos):
-                            self.show_stats()
-                        elif self.essentials.delete_button.collidepoint(mouse_pos):
-                            self.delete_data()
-            pygame.display.flip()
-            self.essentials.clock.tick(60)
-
-    def end_game(self):
-        try:
-            with open("scores.txt", "r") as file:
-                stats = file.readlines()
-        except FileNotFoundError:
-            stats = []
-
-        new_score = str(self.score) + "\n"
-        stats.append(new_score)
-
-        with open("scores.txt", "w") as file:
-            file.writelines(stats)
-        self.essentials.screen.fill((0, 0, 0))
-        final_score = self.essentials.font.render(f"Score: {self.score}", True, (255, 255, 255))
-        game_over = self.essentials.font.render("Game Over", True, (255, 255, 255))
-        try_again = self.essentials.font.render("Home", True, (255, 255, 255))
-        high_score = self.essentials.font.render(f"High Score: {max(stats)}", True, (255, 255, 255))
-        try_again_button = self.essentials.images["try_again_button"]
-    
-        # Calculate positions
-        button_x = self.essentials.screen_width // 2 - try_again_button.get_width() // 2
-        button_y = self.essentials.screen_height // 2 + 100
-        text_x = button_x + (try_again_button.get_width() - try_again.get_width()) // 2
-        text_y = button_y + (try_again_button.get_height() - try_again.get_height()) // 2
-    
-        # Blit elements to the screen
-        self.essentials.screen.blit(final_score, (self.essentials.screen_width // 2 - 150, self.essentials.screen_height // 2 - 100))
-        self.essentials.screen.blit(game_over, (self.essentials.screen_width // 2 - 150, self.essentials.screen_height // 2 - 200))
-        self.essentials.screen.blit(high_score, (self.essentials.screen_width // 2 - 150, self.essentials.screen_height // 2))
-        self.essentials.screen.blit(try_again_button, (button_x, button_y))
-        self.essentials.screen.blit(try_again, (text_x, text_y))
-        
-        while True:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    self.essentials.running = False
-                    return
-                elif event.type == pygame.MOUSEBUTTONDOWN:
-                    pygame.mixer.Sound(self.essentials.wavs["click"]).play()
-                    mouse_pos = pygame.mouse.get_pos()
-                    if self.essentials.button.collidepoint(mouse_pos):
-                        self.home()
-            pygame.display.flip()
-            self.essentials.clock.tick(60)
-
-    def jump(self):
-        if self.jump_cooldown <= 0:
-            pygame.mixer.Sound(self.essentials.wavs["jump"]).play()
-            self.essentials.flappy_velocity = self.essentials.jump_strength
-            self.jump_cooldown = 10  # Reset cooldown
-
-    def generate_pipe(self):
-        pipe_image = self.essentials.images["pipes"]
-        new_pipe = Pipe(pipe_image, self.essentials.screen_width, self.gap_height)
-        self.pipes.append(new_pipe)
-
-    def update_pipes(self):
-        for pipe in self.pipes:
-            pipe.update(self.pipe_speed)
-
-        # Remove pipes that are off the screen
-        self.pipes = [pipe for pipe in self.pipes if not pipe.is_off_screen()]
-
-
-    def apply_physics(self):
-        # Apply gravity
-        self.essentials.flappy_velocity += self.essentials.gravity
-
-        # Update the bird's position
-        self.essentials.flappy_y += self.essentials.flappy_velocity
-
-        # Smoothly adjust the bird's angle based on its velocity
-        max_up_angle = 30  # Maximum upward tilt angle
-        max_down_angle = -20  # Maximum downward tilt angle
-        rotation_speed = 2  # Speed at which the bird rotates
-
-        if self.essentials.flappy_velocity < 0:  # Bird is going up
-            target_angle = max_up_angle
-        else:  # Bird is going down
-            target_angle = max_down_angle
-
-        # Smoothly interpolate the current angle towards the target angle
-        if self.essentials.flappy_angle > target_angle:
-            self.essentials.flappy_angle = max(self.essentials.flappy_angle - rotation_speed, target_angle)
-        elif self.essentials.flappy_angle < target_angle:
-            self.essentials.flappy_angle = min(self.essentials.flappy_angle + rotation_speed, target_angle)
-
-        # Prevent the bird from going off the screen with padding
-        padding = 20  # Padding to avoid immediate game over when near edges
-        if self.essentials.flappy_y > self.essentials.screen_height - padding or self.essentials.flappy_y < padding:
-            self.end_game()
-
-        # Decrease jump cooldown timer
-        if self.jump_cooldown > 0:
-            self.jump_cooldown -= 1
+        stats_button_x = (self.essentials.screen_width // 2 - try_again_button.get_width() // 2) - 400
+        stats_button_y = (self.essentials.screen_height // 2) + 200
 
-    def draw(self, game=False):
-        # Scroll the background
-        self.essentials.bg_x -= self.essentials.bg_speed
-        if abs(self.essentials.bg_x) > self.essentials.images["background"].get_width():
-            self.essentials.bg_x = 0
+        delete_button_x = (self.essentials.screen_width // 2 - try_again_button.get_width() // 2)
+        delete_button_y = (self.essentials.screen_height // 2)
 
-        # Draw the scrolling background
-        self.essentials.screen.blit(self.essentials.images["background"], (self.essentials.bg_x, 0))
-        self.essentials.screen.blit(self.essentials.images["background"], (self.essentials.bg_x + self.essentials.images["background"].get_width(), 0))
+        # Define buttons
+        self.run_button = pygame.Rect(play_button_x, play_button_y, try_again_button.get_width(), try_again_button.get_height())
+        self.stats_button = pygame.Rect(stats_button_x, stats_button_y, try_again_button.get_width(), try_again_button.get_height())
+        self.delete_stats_button = pygame.Rect(delete_button_x, delete_button_y, try_again_button.get_width(), try_again_button.get_height())
+
+        # Composite buttons and their centred text
+        for button, label in ((self.run_button, "Play"), (self.stats_button, "Stats"), (self.delete_stats_button, "Delete Stats")):
+            layer.add(try_again_button, button.topleft)
+            layer.add_centered(self.essentials.text.render(label), button.center)
+        return layer
+
+    def record_score(self):
+        """Persist the score of the game that just ended."""
+        # Recording a score and reading the high score do not depend on the history size
+        self.score_log.append(self.score)
+        if self.stats_store:
+            # Queued for the background writer, this never waits on the disk
+            self.stats_store.record_run(self.score, time.perf_counter() - self.run_started, self.simulation.tick,
+                                        len(self.simulation.pass_ticks), self.simulation.death_cause, self.simulation.seed)
+
+    def draw(self, game=False):
+        if self.essentials.quality.effects["scrolling_background"]:
+            # Scroll the background by the time that passed, so it moves at the same speed at any frame rate
+            now = time.perf_counter()
+            elapsed = min(now - self.essentials.bg_time, self.essentials.max_frame_time)
+            self.essentials.bg_time = now
+            self.essentials.bg_x -= self.essentials.bg_speed * self.essentials.tick_rate * elapsed
+            if abs(self.essentials.bg_x) > self.essentials.images["background"].get_width():
+                self.essentials.bg_x += self.essentials.images["background"].get_width()
+
+            # Draw the scrolling background
+            self.essentials.screen.blit(self.essentials.images["background"], (self.essentials.bg_x, 0))
+            self.essentials.screen.blit(self.essentials.images["background"], (self.essentials.bg_x + self.essentials.images["background"].get_width(), 0))
+        else:
+            # A still background covers the screen with a single blit
+            self.essentials.screen.blit(self.essentials.images["background"], (0, 0))
 
         if game:
+            # Ghosts first, so the live bird stays on top
+            if self.ghosts:
+                self.ghosts.draw(self.essentials.screen, self.simulation.tick, self.render_alpha)
+            if self.rivals:
+                self.rivals.draw(self.essentials.screen)
+
             # Draw the bird with its current rotation
-            rotated_bird = pygame.transform.rotate(self.essentials.images["flappy_bird"], self.essentials.flappy_angle)
-            self.essentials.screen.blit(rotated_bird, (50, self.essentials.flappy_y))
+            rotated_bird, _, (offset_x, offset_y) = self.bird_frames.frame(self.essentials.flappy_angle)
+            self.essentials.screen.blit(rotated_bird, (50 + offset_x, self.essentials.flappy_y + offset_y))
 
             # Draw pipes
             for pipe in self.pipes:
-                pipe.draw(self.essentials.screen)
+                pipe.draw(self.essentials.screen, self.render_alpha)
 
             # Draw the score
-            score_text = self.essentials.font.render(f"Score: {self.score}", True, (255, 255, 255))
-            self.essentials.screen.blit(score_text, (10, 10))
-
-    def run(self):
-        index = 3
-        TIME = 0
-
-        # Render the initial "Get Ready" message
-        get_ready = self.essentials.font.render(f"Get Ready {index}", True, (255, 255, 255))
-
-        # Main loop to display the "Get Ready" message and update the screen
-        while index != 0:
-            # Clear the screen and draw the background
-            self.essentials.screen.blit(self.essentials.images["background"], (0, 0))
-
-            # Draw the bird
-            self.essentials.screen.blit(self.essentials.images["flappy_bird"], (50, self.essentials.flappy_y))
-
-            # Draw the "Get Ready" message
-            get_ready = self.essentials.font.render(f"Get Ready {index}", True, (255, 255, 255))
-            self.essentials.screen.blit(get_ready, (self.essentials.screen_width // 2 - 150, self.essentials.screen_height // 2 - 100))
-
-            # Update the display
-            pygame.display.flip()
-
-            # Wait for 1 second
-            pygame.time.wait(1000)
-
-            # Increment the time and index
-            TIME += 1000
-            if TIME % 1000 == 0:
-                index -= 1
-
-            # Tick the clock
-            self.essentials.clock.tick(60)
-
-        # Reset the game after the loop
-        self.reset_game()
-        while self.essentials.running:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    self.essentials.running = False
-                elif event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_SPACE:
-                        self.jump()
-
-            # Generate new pipes at regular intervals
-            current_time = pygame.time.get_ticks()
-            if current_time - self.last_pipe_time > self.pipe_interval:
-                self.generate_pipe()
-                self.last_pipe_time = current_time
-
-            # Update and draw everything
-            self.apply_physics()
-            self.update_pipes()
-
-            # Check for collisions with pipes
-            bird_pos = (50, self.essentials.flappy_y)
-            for pipe in self.pipes:
-                (mask_top, top_pos), (mask_bottom, bottom_pos) = pipe.get_masks()
-                if self.bird_mask.overlap(mask_top, (top_pos[0] - bird_pos[0], top_pos[1] - bird_pos[1])) or self.bird_mask.overlap(mask_bottom, (bottom_pos[0] - bird_pos[0], bottom_pos[1] - bird_pos[1])):
-                    self.end_game()
-                    break  # End the game immediately if a collision is detected
-                if pipe.x == 50:
-                    # Bird has passed the pipe successfully
-                    self.score += 1
-
-            self.draw(game=True)
-
-            # Refresh the screen
-            pygame.display.flip()
-            self.essentials.clock.tick(60)
-
+            self.score_renderer.draw(self.essentials.screen, (10, 10), self.score)
+
+    def save_recording(self):
+        """Write the replay of the run that just ended, if replays are being recorded."""
+        if not self.recording:
+            return
+        self.recording.finish(self.simulation)
+        os.makedirs(self.replay_dir, exist_ok=True)
+        self.recording.save(os.path.join(self.replay_dir, f"{int(time.time())}_{self.simulation.seed}.fbr"))
+        self.recording = None
+
+    def main_loop(self, scene):
+        """Run the scenes, starting with scene, until the window is closed."""
+        profiler = self.essentials.profiler
+        scene.enter()
+        self.essentials.restart_frame_timing()
+        while True:
+            if scene.idle:
+                # The sleep until the next event is not part of the frame
+                events = self.essentials.wait_events()
+                profiler.begin_frame()
+            else:
+                profiler.begin_frame()
+                events = self.essentials.poll_events()
+            if any(event.type == pygame.QUIT for event in events):
+                break
+            profiler.mark("events")
+
+            # Scenes hand over by returning the next one, so nothing ever nests
+            next_scene = scene.update(events)
+            if next_scene is not scene:
+                scene = next_scene
+                scene.enter()
+                if not scene.idle:
+                    self.essentials.restart_frame_timing()
+            scene.draw()
+            if not scene.idle:
+                self.essentials.end_frame()
+            else:
+                # Idle scenes present their own frames, close the profiler frame here
+                profiler.mark("draw")
+                profiler.end_frame()
+        self.close()
+
+    def close(self):
+        """Stop the audio, flush the score stores and close the window."""
+        self.essentials.running = False
+        self.essentials.audio.stop()
+        latencies = self.essentials.input.latency_percentiles()
+        if latencies and self.essentials.profiler.enabled:
+            print("Jump to screen latency: " + "  ".join(f"p{percent} {ms:.1f} ms" for percent, ms in latencies.items()))
+        if self.essentials.capture is not None:
+            self.essentials.capture.close()
+        self.score_log.close()
+        if self.stats_store:
+            self.stats_store.close()
         pygame.quit()
-        sys.exit()
 
 
 if __name__ == "__main__":
-    game = FlappyBirdGame()
-    game.home()
+    parser = argparse.ArgumentParser(description="Flappy Bird")
+    parser.add_argument("--stats-db", help="record every run in this SQLite database")
+    parser.add_argument("--max-fps", type=int, default=60, help="rendering frame cap, 0 for uncapped")
+    parser.add_argument("--record-replays", metavar="DIR", help="save a replay of every run in this directory")
+    parser.add_argument("--play-replay", metavar="FILE", help="watch a recorded replay")
+    parser.add_argument("--ghosts", metavar="DIR", help="race against the replays in this directory")
+    parser.add_argument("--join", metavar="HOST[:PORT]", help="race other players on a LAN host (see multiplayer.py)")
+    parser.add_argument("--capture", metavar="DIR", help="record gameplay video into this directory")
+    parser.add_argument("--capture-format", choices=["auto", "ffmpeg", "png", "raw"], default="auto",
+                        help="ffmpeg video, PNG sequence or raw frames; auto uses ffmpeg when it is installed")
+    parser.add_argument("--render-scale", type=float, default=1.0,
+                        help="internal resolution as a fraction of the window, 0.5 draws at half size")
+    parser.add_argument("--no-adaptive-quality", action="store_true",
+                        help="keep the render scale and effects fixed instead of adapting them to the frame time")
+    parser.add_argument("--profile", action="store_true", help="time every frame phase from the start (F3 shows the overlay) and report jump latency on exit")
+    parser.add_argument("--trace-out", default="frame_trace.json", help="where F4 writes the Chrome trace")
+    args = parser.parse_args()
+    if not 0 < args.render_scale <= 1:
+        parser.error("--render-scale must be above 0 and at most 1")
+
+    game = FlappyBirdGame(stats_path=args.stats_db, max_fps=args.max_fps, replay_dir=args.record_replays,
+                          profile=args.profile, trace_path=args.trace_out, ghost_dir=args.ghosts,
+                          capture_dir=args.capture, capture_format=args.capture_format,
+                          render_scale=args.render_scale, adaptive_quality=not args.no_adaptive_quality)
+    if args.play_replay:
+        game.main_loop(CountdownScene(game, Replay.load(args.play_replay)))
+    elif args.join:
+        host, _, port = args.join.partition(":")
+        game.main_loop(RaceScene(game, (host, int(port or DEFAULT_PORT))))
+    else:
+        game.main_loop(HomeScene(game))
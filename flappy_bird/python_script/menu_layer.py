@@ -0,0 +1,33 @@
+import pygame
+
+"""
+Helpers for menu screens.
+A StaticLayer holds everything on a screen that never changes, composited once, so a
+menu frame is a single blit.
+"""
+
+
+class StaticLayer:
+    def __init__(self, size, fill=None):
+        if fill is None:
+            # Transparent layer drawn over something else, like the scrolling background
+            self.surface = pygame.Surface(size, pygame.SRCALPHA).convert_alpha()
+        else:
+            # Opaque layer that covers the whole screen
+            self.surface = pygame.Surface(size).convert()
+            self.surface.fill(fill)
+
+    def add(self, image, position):
+        """Composite image onto the layer and return the rect it covers."""
+        return self.surface.blit(image, position)
+
+    def add_centered(self, image, center):
+        """Composite image onto the layer centred on center and return the rect it covers."""
+        return self.surface.blit(image, image.get_rect(center=center))
+
+    def restore(self, screen, rect):
+        """Redraw the layer over rect only, erasing whatever was drawn there."""
+        return screen.blit(self.surface, rect, rect)
+
+    def draw(self, screen):
+        return screen.blit(self.surface, (0, 0))
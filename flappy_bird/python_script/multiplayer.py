@@ -0,0 +1,529 @@
+import argparse
+import heapq
+import os
+import random
+import socket
+import struct
+import sys
+import threading
+import time
+
+"""
+LAN multiplayer over UDP.
+The host is authoritative: it runs one simulation per player, all on the same seeded
+pipe course, applies every player's jumps at the tick they were made for (or as soon as
+they arrive, when they are late) and sends each client a snapshot every tick.
+
+A snapshot carries the client's own bird at full precision, so the client can check
+its prediction exactly, plus the other birds quantized and delta compressed against the
+last snapshot that client acknowledged: birds that did not change are left out and
+changed birds only send the fields that changed.
+
+Clients predict their own bird locally and send their recent jumps with every input
+packet until the host confirms them, so a lost packet costs nothing. When a snapshot
+disagrees with the prediction, the client rewinds its bird to the host's state and
+replays its own jumps since then.
+
+    python multiplayer.py host --players 4
+    python multiplayer.py bots --count 4
+    python multiplayer.py local --count 16 --seconds 20 --loss 0.05
+"""
+
+PROTOCOL = 1
+DEFAULT_PORT = 5999
+NO_TICK = -1
+
+JOIN = 1
+WELCOME = 2
+FULL = 3
+INPUT = 4
+SNAPSHOT = 5
+
+JOIN_PACKET = struct.Struct("<BB")  # Type, protocol
+WELCOME_PACKET = struct.Struct("<BBQddii")  # Type, player id, seed, gravity, jump strength, gap height, pipe speed
+INPUT_PACKET = struct.Struct("<BBiiB")  # Type, player id, acknowledged snapshot, inputs sent through tick, jump count
+JUMP = struct.Struct("<i")
+SNAPSHOT_PACKET = struct.Struct("<BiiiddhBHBB")  # Type, tick, baseline, inputs received through, y, velocity, angle, cooldown, score, done, players
+PLAYER = struct.Struct("<BB")  # Player id, changed fields
+
+# Fields of another player's bird, as (mask bit, struct)
+FIELDS = (
+    (1, struct.Struct("<h")),  # Height in quarter pixels
+    (2, struct.Struct("<b")),  # Angle
+    (4, struct.Struct("<H")),  # Score
+    (8, struct.Struct("<B")),  # Flags, 1 while alive
+)
+MAX_JUMPS = 16  # Most unconfirmed jumps repeated in one input packet
+HISTORY = 120  # Snapshots kept as delta baselines, two seconds
+
+
+def public_state(simulation):
+    """Return the quantized state other players see of this bird."""
+    return (round(simulation.flappy_y * 4), int(simulation.flappy_angle), simulation.score, 0 if simulation.done else 1)
+
+
+def encode_players(states, baseline):
+    """Encode {player id: state} as the changes from baseline (None for everything)."""
+    out = bytearray()
+    count = 0
+    for player_id, state in states.items():
+        previous = baseline.get(player_id) if baseline is not None else None
+        mask = 0
+        for index, (bit, _) in enumerate(FIELDS):
+            if previous is None or previous[index] != state[index]:
+                mask |= bit
+        if not mask:
+            continue
+        out += PLAYER.pack(player_id, mask)
+        for index, (bit, field) in enumerate(FIELDS):
+            if mask & bit:
+                out += field.pack(state[index])
+        count += 1
+    return count, bytes(out)
+
+
+def decode_players(data, offset, count, baseline):
+    """Apply count encoded player changes to a copy of baseline and return it."""
+    states = dict(baseline)
+    for _ in range(count):
+        player_id, mask = PLAYER.unpack_from(data, offset)
+        offset += PLAYER.size
+        state = list(states.get(player_id, (0, 0, 0, 0)))
+        for index, (bit, field) in enumerate(FIELDS):
+            if mask & bit:
+                (state[index],) = field.unpack_from(data, offset)
+                offset += field.size
+        states[player_id] = tuple(state)
+    return states
+
+
+class Player:
+    def __init__(self, player_id, address, simulation):
+        self.player_id = player_id
+        self.address = address
+        self.simulation = simulation
+        self.pending = []  # Heap of jump ticks waiting to be applied
+        self.received_through = NO_TICK  # Every input up to this tick has arrived
+        self.acknowledged = NO_TICK  # Newest snapshot the client confirmed
+        self.last_seen = time.monotonic()
+
+
+class Host:
+    def __init__(self, port=DEFAULT_PORT, max_players=16, seed=None, lobby_seconds=10.0, timeout=5.0, bind="0.0.0.0"):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind((bind, port))
+        self.socket.setblocking(False)
+        self.port = self.socket.getsockname()[1]
+        self.max_players = max_players
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)
+        self.lobby_seconds = lobby_seconds  # How long the lobby waits after the first join
+        self.timeout = timeout  # Players silent for this long are out of the race
+
+        from simulation import build_simulations
+        self.simulations = build_simulations(max_players)
+        for simulation in self.simulations:
+            simulation.reset(self.seed)
+        self.players = {}  # Address -> Player
+        self.tick = 0
+        self.started = False
+        self.first_join = None
+        self.history = {}  # Tick -> {player id: public state}
+        self.bytes_sent = 0
+        self.packets_sent = 0
+
+    def send(self, data, address):
+        self.socket.sendto(data, address)
+        self.bytes_sent += len(data)
+        self.packets_sent += 1
+
+    def welcome(self, player):
+        simulation = player.simulation
+        self.send(WELCOME_PACKET.pack(WELCOME, player.player_id, self.seed, simulation.gravity, simulation.jump_strength,
+                                      simulation.gap_height, simulation.pipe_speed), player.address)
+
+    def receive(self):
+        while True:
+            try:
+                data, address = self.socket.recvfrom(2048)
+            except (BlockingIOError, ConnectionResetError):
+                return
+            if not data:
+                continue
+            kind = data[0]
+            player = self.players.get(address)
+            if kind == JOIN and len(data) >= JOIN_PACKET.size:
+                if player is None:
+                    if self.started or len(self.players) >= self.max_players or data[1] != PROTOCOL:
+                        self.send(bytes([FULL]), address)
+                        continue
+                    player = Player(len(self.players), address, self.simulations[len(self.players)])
+                    self.players[address] = player
+                    if self.first_join is None:
+                        self.first_join = time.monotonic()
+                self.welcome(player)  # Again if the first welcome was lost
+            elif kind == INPUT and player is not None and len(data) >= INPUT_PACKET.size:
+                self.receive_input(player, data)
+
+    def receive_input(self, player, data):
+        _, _, acknowledged, sent_through, count = INPUT_PACKET.unpack_from(data)
+        player.last_seen = time.monotonic()
+        player.acknowledged = max(player.acknowledged, acknowledged)
+        offset = INPUT_PACKET.size
+        for _ in range(min(count, MAX_JUMPS)):
+            (tick,) = JUMP.unpack_from(data, offset)
+            offset += JUMP.size
+            if tick > player.received_through:
+                heapq.heappush(player.pending, tick)
+        player.received_through = max(player.received_through, sent_through)
+
+    def ready_to_start(self):
+        if not self.players:
+            return False
+        return len(self.players) >= self.max_players or time.monotonic() - self.first_join >= self.lobby_seconds
+
+    def step(self):
+        """Advance the race by one tick and send every client its snapshot."""
+        self.receive()
+        if not self.started:
+            if not self.ready_to_start():
+                return
+            self.started = True
+
+        now = time.monotonic()
+        for player in self.players.values():
+            simulation = player.simulation
+            if simulation.done:
+                continue
+            if now - player.last_seen > self.timeout:
+                simulation.done = True
+                simulation.death_cause = "disconnected"
+                continue
+
+            # Jumps meant for this tick, or for an earlier one when they arrived late
+            jump = False
+            while player.pending and player.pending[0] <= self.tick:
+                heapq.heappop(player.pending)
+                jump = True
+            simulation.step(jump)
+        self.tick += 1
+
+        states = {player.player_id: public_state(player.simulation) for player in self.players.values()}
+        self.history[self.tick] = states
+        self.history.pop(self.tick - HISTORY, None)
+        for player in self.players.values():
+            self.send(self.snapshot(player, states), player.address)
+
+    def snapshot(self, player, states):
+        simulation = player.simulation
+        baseline_tick = player.acknowledged if player.acknowledged in self.history else NO_TICK
+        baseline = self.history.get(baseline_tick)
+        others = {player_id: state for player_id, state in states.items() if player_id != player.player_id}
+        if baseline is not None:
+            baseline = {player_id: state for player_id, state in baseline.items() if player_id != player.player_id}
+        count, players = encode_players(others, baseline)
+        header = SNAPSHOT_PACKET.pack(SNAPSHOT, self.tick, baseline_tick, player.received_through,
+                                      simulation.flappy_y, simulation.flappy_velocity, int(simulation.flappy_angle),
+                                      simulation.jump_cooldown, simulation.score, simulation.done, count)
+        return header + players
+
+    def finished(self):
+        return self.started and all(player.simulation.done for player in self.players.values())
+
+    def results(self):
+        """Return [(player id, score, ticks survived, cause of death)] best first."""
+        results = [(player.player_id, player.simulation.score, player.simulation.tick, player.simulation.death_cause)
+                   for player in self.players.values()]
+        return sorted(results, key=lambda result: (-result[1], -result[2]))
+
+    def run(self, tick_rate=60, max_seconds=None):
+        """Host one race at tick_rate ticks per second and return its results."""
+        tick_time = 1 / tick_rate
+        next_tick = time.perf_counter()
+        started_at = time.perf_counter()
+        while not self.finished():
+            if max_seconds is not None and time.perf_counter() - started_at > max_seconds:
+                break
+            self.step()
+            next_tick += tick_time
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.perf_counter()  # Running late, do not try to catch up in a burst
+        return self.results()
+
+    def close(self):
+        self.socket.close()
+
+
+class Client:
+    def __init__(self, address, simulation, lead_ticks=2, loss=0.0, bird_frames=None):
+        self.address = address
+        self.simulation = simulation
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        self.lead_ticks = lead_ticks  # Ticks the prediction runs ahead of the newest snapshot
+        self.loss = loss  # Fraction of packets dropped on purpose, to test over a perfect localhost
+        self.random = random.Random()
+
+        self.player_id = None
+        self.refused = False  # The host was full or already racing
+        self.started = False
+        self.done = False
+        self.score = 0
+        self.jumps = []  # Ticks of jumps the host has not confirmed yet, ascending
+        self.replay_jumps = set()  # Every jump tick still needed to replay the prediction
+        self.predicted = {}  # Tick -> own bird state the prediction reached
+        self.latest_tick = NO_TICK  # Newest snapshot received
+        self.history = {}  # Snapshot tick -> {player id: public state}
+        self.others = {}  # Player id -> public state of the other birds
+
+        # Sprites to draw the other birds with, only a client with a screen needs them
+        self.sprites = None
+        if bird_frames is not None:
+            from ghosts import BirdSprites
+            self.sprites = BirdSprites(bird_frames, simulation.bird_x, opacity=140)
+
+        self.bytes_received = 0
+        self.snapshots = 0
+        self.corrections = 0
+        self.max_correction = 0.0
+
+    def send(self, data):
+        if self.loss and self.random.random() < self.loss:
+            return
+        self.socket.sendto(data, self.address)
+
+    def request_join(self):
+        self.send(JOIN_PACKET.pack(JOIN, PROTOCOL))
+
+    def join(self, timeout=10.0):
+        """Ask the host for a place in the race. Returns False if it is full or does not answer."""
+        return bool(join_all([self], timeout))
+
+    def poll(self):
+        """Handle every packet that arrived."""
+        while True:
+            try:
+                data, _ = self.socket.recvfrom(4096)
+            except (BlockingIOError, ConnectionResetError):
+                return
+            if not data or (self.loss and self.random.random() < self.loss):
+                continue
+            self.bytes_received += len(data)
+            kind = data[0]
+            if kind == WELCOME and self.player_id is None:
+                _, self.player_id, seed, gravity, jump_strength, gap_height, pipe_speed = WELCOME_PACKET.unpack_from(data)
+                simulation = self.simulation
+                simulation.gravity, simulation.jump_strength = gravity, jump_strength
+                simulation.gap_height, simulation.pipe_speed = gap_height, pipe_speed
+                simulation.reset(seed)
+            elif kind == FULL and self.player_id is None:
+                self.refused = True
+            elif kind == SNAPSHOT and self.player_id is not None:
+                self.receive_snapshot(data)
+
+    def bird_state(self):
+        simulation = self.simulation
+        return simulation.flappy_y, simulation.flappy_velocity, simulation.flappy_angle, simulation.jump_cooldown
+
+    def receive_snapshot(self, data):
+        (_, tick, baseline_tick, received_through, y, velocity, angle, cooldown, score, done,
+         count) = SNAPSHOT_PACKET.unpack_from(data)
+        if tick <= self.latest_tick:
+            return  # Out of order
+        if baseline_tick == NO_TICK:
+            baseline = {}
+        elif baseline_tick in self.history:
+            baseline = self.history[baseline_tick]
+        else:
+            return  # Its baseline is gone, the next snapshot will use a newer one
+        self.others = decode_players(data, SNAPSHOT_PACKET.size, count, baseline)
+        self.history[tick] = self.others
+        for old_tick in [old_tick for old_tick in self.history if old_tick < tick - HISTORY]:
+            del self.history[old_tick]
+        self.latest_tick = tick
+        self.snapshots += 1
+        self.score = score
+        self.started = True
+
+        # The host has every jump up to received_through, stop repeating them
+        while self.jumps and self.jumps[0] <= received_through:
+            self.jumps.pop(0)
+        if done:
+            self.done = True
+            self.simulation.done = True
+            return
+
+        # Bring the course up to the snapshot before comparing birds
+        while self.simulation.tick < tick:
+            self.predict(False)
+        self.reconcile(tick, (y, velocity, angle, cooldown))
+
+        # Keep the prediction a little ahead of the host, so jumps arrive before their tick
+        while self.simulation.tick < tick + self.lead_ticks:
+            self.predict(False)
+
+    def reconcile(self, tick, state):
+        """Rewind to the host's state at tick and replay the jumps made since, if the prediction was off."""
+        predicted = self.predicted.pop(tick, None)
+        for old_tick in [old_tick for old_tick in self.predicted if old_tick < tick]:
+            del self.predicted[old_tick]
+        self.replay_jumps = {jump for jump in self.replay_jumps if jump >= tick}
+        if predicted == state:
+            return
+
+        simulation = self.simulation
+        if predicted is not None:
+            self.corrections += 1
+            self.max_correction = max(self.max_correction, abs(predicted[0] - state[0]))
+        current_tick = simulation.tick
+        simulation.flappy_y, simulation.flappy_velocity, simulation.flappy_angle, simulation.jump_cooldown = state
+        simulation.done = False  # Only the host decides when this bird is out
+        simulation.death_cause = None
+        for replay_tick in range(tick, current_tick):
+            if replay_tick in self.replay_jumps:
+                simulation.jump()
+            simulation.apply_physics()
+            self.predicted[replay_tick + 1] = self.bird_state()
+        simulation.done = False
+
+    def predict(self, jump):
+        """Advance the own bird and the course by one tick."""
+        simulation = self.simulation
+        tick = simulation.tick
+        if jump:
+            self.jumps.append(tick)
+            self.replay_jumps.add(tick)
+        simulation.step(jump)
+        simulation.done = False  # Collisions are predicted for effects only, the host decides
+        self.predicted[simulation.tick] = self.bird_state()
+
+    def tick(self, jump=False):
+        """Predict one tick with the player's input and send it to the host."""
+        if not self.started or self.done:
+            return
+        if self.simulation.tick < self.latest_tick + self.lead_ticks + 30:
+            self.predict(jump)  # Far ahead of the host means it stalled, wait for it
+        self.send_input()
+
+    def send_input(self):
+        jumps = self.jumps[-MAX_JUMPS:]
+        packet = INPUT_PACKET.pack(INPUT, self.player_id, self.latest_tick, self.simulation.tick - 1, len(jumps))
+        self.send(packet + b"".join(JUMP.pack(tick) for tick in jumps))
+
+    def draw(self, screen):
+        """Draw the other birds still in the race as of the newest snapshot."""
+        self.sprites.draw(screen, ((height / 4, angle) for height, angle, _, flags in self.others.values() if flags & 1))
+
+    def close(self):
+        self.socket.close()
+
+
+def bot_policy(simulation, rng):
+    """Flap when the bird falls below the middle of the next gap."""
+    y, velocity, _, top, bottom = simulation.observation()
+    return y > (top + bottom) / 2 + 40 + rng.randint(-30, 30) and velocity > -1
+
+
+def join_all(clients, timeout=10.0):
+    """Ask the host for a place for every client at once. Returns the clients that got one."""
+    deadline = time.monotonic() + timeout
+    waiting = list(clients)
+    while waiting and time.monotonic() < deadline:
+        # Every request goes out before any answer is awaited, so the lobby cannot close halfway
+        for client in waiting:
+            client.request_join()
+        resend = time.monotonic() + 0.25
+        while waiting and time.monotonic() < resend:
+            for client in waiting:
+                client.poll()
+            waiting = [client for client in waiting if client.player_id is None and not client.refused]
+            time.sleep(0.005)
+    return [client for client in clients if client.player_id is not None]
+
+
+def run_bots(address, count, tick_rate=60, loss=0.0, max_seconds=None):
+    """Play count bot clients against the host at address until they are all out. Returns every client, joined or not."""
+    from simulation import build_simulations
+    simulations = build_simulations(count)
+    clients = [Client(address, simulation, loss=loss) for simulation in simulations]
+    joined = join_all(clients)
+    if len(joined) < count:
+        print(f"{count - len(joined)} of {count} bots could not join {address[0]}:{address[1]}")
+    rngs = [random.Random(index) for index in range(count)]
+    bots = [(client, rng) for client, rng in zip(clients, rngs) if client.player_id is not None]
+    tick_time = 1 / tick_rate
+    next_tick = time.perf_counter()
+    started_at = time.perf_counter()
+    while not all(client.done for client in joined):
+        if max_seconds is not None and time.perf_counter() - started_at > max_seconds:
+            break
+        for client, rng in bots:
+            client.poll()
+            client.tick(client.started and bot_policy(client.simulation, rng))
+        next_tick += tick_time
+        delay = next_tick - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            next_tick = time.perf_counter()
+    return clients
+
+
+def report(clients, seconds):
+    for client in clients:
+        if client.player_id is None:
+            continue  # Never got into the race
+        print(f"player {client.player_id:2}: score {client.score:3}  {client.snapshots:5} snapshots  "
+              f"{client.bytes_received / max(seconds, 1e-9) / 1024:6.1f} KiB/s down  "
+              f"{client.corrections:3} corrections (largest {client.max_correction:.1f} px)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flappy bird LAN races")
+    parser.add_argument("mode", choices=["host", "bots", "local"], help="host a race, join one with bots, or both over localhost")
+    parser.add_argument("--host", default="127.0.0.1", help="address of the host to join")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--players", type=int, default=16, help="most players in a hosted race")
+    parser.add_argument("--count", type=int, default=4, help="number of bots")
+    parser.add_argument("--seed", type=int, help="course seed, random by default")
+    parser.add_argument("--lobby", type=float, default=10.0, help="seconds the lobby stays open after the first join")
+    parser.add_argument("--seconds", type=float, help="stop after this long")
+    parser.add_argument("--loss", type=float, default=0.0, help="fraction of bot packets to drop")
+    args = parser.parse_args()
+
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+    if args.mode == "bots":
+        started_at = time.perf_counter()
+        clients = run_bots((args.host, args.port), args.count, loss=args.loss, max_seconds=args.seconds)
+        report(clients, time.perf_counter() - started_at)
+        sys.exit(0)
+
+    players = args.count if args.mode == "local" else args.players
+    host = Host(args.port, players, args.seed, args.lobby)
+    print(f"Hosting on port {host.port}, course seed {host.seed}")
+    if args.mode == "host":
+        results = host.run(max_seconds=args.seconds)
+    else:
+        # Host in a thread, bots in this one, both over localhost
+        outcome = {}
+        thread = threading.Thread(target=lambda: outcome.update(results=host.run(max_seconds=args.seconds)), daemon=True)
+        thread.start()
+        started_at = time.perf_counter()
+        clients = run_bots(("127.0.0.1", host.port), args.count, loss=args.loss, max_seconds=args.seconds)
+        thread.join()
+        seconds = time.perf_counter() - started_at
+        report(clients, seconds)
+        results = outcome["results"]
+        scores = {player_id: score for player_id, score, _, _ in results}
+        joined = [client for client in clients if client.player_id is not None]
+        agreed = sum(client.score == scores.get(client.player_id) for client in joined)
+        print(f"{agreed}/{len(joined)} joined clients agree with the host on their score")
+    seconds = max(host.tick / 60, 1e-9)
+    print(f"Host sent {host.packets_sent} packets, {host.bytes_sent / seconds / 1024:.1f} KiB/s over {host.tick} ticks")
+    for player_id, score, ticks, cause in results:
+        print(f"player {player_id:2}: {score:3} points, {ticks} ticks, {cause}")
+    host.close()
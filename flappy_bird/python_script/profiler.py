@@ -0,0 +1,148 @@
+import json
+import time
+from array import array
+
+import pygame
+
+"""
+Per-frame phase profiler.
+Loops call begin_frame(), mark(phase) after each phase and end_frame(). Phase times are
+kept in fixed-size ring buffers, so profiling never allocates per frame, and every call
+returns straight away while the profiler is disabled. The overlay shows a frame time
+graph with p50/p99 per phase, and the recorded events export to Chrome's trace format
+(open chrome://tracing or https://ui.perfetto.dev and load the file).
+"""
+
+PHASES = ("events", "pipe generation", "physics", "update pipes", "collision", "draw", "flip", "tick wait")
+
+
+class FrameProfiler:
+    def __init__(self, frames=600, events_per_frame=24, enabled=False):
+        self.enabled = enabled
+        self.overlay = False
+        self.phase_index = {phase: index for index, phase in enumerate(PHASES)}
+
+        # Per-frame totals for every phase, one row of len(PHASES) per frame
+        self.frames = frames
+        self.frame_times = array("q", bytes(8 * frames * len(PHASES)))
+        self.frame_count = 0
+
+        # Individual phase events for the trace export
+        self.events = frames * events_per_frame
+        self.event_phase = array("b", bytes(self.events))
+        self.event_start = array("q", bytes(8 * self.events))
+        self.event_duration = array("q", bytes(8 * self.events))
+        self.event_count = 0
+
+        self.row = 0
+        self.last = 0
+        self.enable_next_frame = False  # Turned on mid-frame, start recording at the next begin_frame()
+        self.origin = time.perf_counter_ns()
+        self.overlay_surface = None
+
+    def begin_frame(self):
+        if self.enable_next_frame:
+            self.enabled = True
+            self.enable_next_frame = False
+        if not self.enabled:
+            return
+        self.row = (self.frame_count % self.frames) * len(PHASES)
+        for index in range(self.row, self.row + len(PHASES)):
+            self.frame_times[index] = 0
+        self.last = time.perf_counter_ns()
+
+    def mark(self, phase):
+        """Charge the time since the previous mark to phase."""
+        if not self.enabled:
+            return
+        now = time.perf_counter_ns()
+        index = self.phase_index[phase]
+        duration = now - self.last
+        self.frame_times[self.row + index] += duration
+
+        slot = self.event_count % self.events
+        self.event_phase[slot] = index
+        self.event_start[slot] = self.last - self.origin
+        self.event_duration[slot] = duration
+        self.event_count += 1
+        self.last = now
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        self.frame_count += 1
+
+    def recorded_frames(self):
+        """Return the ring rows of the recorded frames, oldest first."""
+        count = min(self.frame_count, self.frames)
+        first = self.frame_count - count
+        return [(first + frame) % self.frames * len(PHASES) for frame in range(count)]
+
+    def percentiles(self):
+        """Return {phase: (p50 ms, p99 ms)} over the recorded frames."""
+        rows = self.recorded_frames()
+        result = {}
+        if not rows:
+            return result
+        for index, phase in enumerate(PHASES):
+            times = sorted(self.frame_times[row + index] for row in rows)
+            result[phase] = (times[len(times) // 2] / 1e6, times[min(len(times) - 1, len(times) * 99 // 100)] / 1e6)
+        return result
+
+    def frame_totals(self):
+        """Return the total time of every recorded frame in ms, oldest first."""
+        return [sum(self.frame_times[row:row + len(PHASES)]) / 1e6 for row in self.recorded_frames()]
+
+    def export_chrome_trace(self, path):
+        """Write the recorded events as Chrome trace-event JSON."""
+        count = min(self.event_count, self.events)
+        first = self.event_count - count
+        trace = []
+        for event in range(first, self.event_count):
+            slot = event % self.events
+            trace.append({
+                "name": PHASES[self.event_phase[slot]],
+                "ph": "X",
+                "ts": self.event_start[slot] / 1000,
+                "dur": self.event_duration[slot] / 1000,
+                "pid": 1,
+                "tid": 1,
+            })
+        with open(path, "w") as file:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, file)
+
+    def toggle_overlay(self):
+        self.overlay = not self.overlay
+        if self.overlay and not self.enabled:
+            self.enable_next_frame = True  # Marks before the next begin_frame() would have no start time
+        self.overlay_surface = None
+
+    def draw_overlay(self, screen, text_cache, refresh_every=30):
+        """Draw the frame time graph and phase percentiles, rebuilt every refresh_every frames."""
+        if not self.overlay:
+            return
+        if self.overlay_surface is None or self.frame_count % refresh_every == 0:
+            self.overlay_surface = self.build_overlay(text_cache)
+        screen.blit(self.overlay_surface, (screen.get_width() - self.overlay_surface.get_width() - 10, 10))
+
+    def build_overlay(self, text_cache, width=420, graph_height=100, budget_ms=1000 / 60):
+        line_height = 22
+        surface = pygame.Surface((width, graph_height + line_height * (len(PHASES) + 1) + 20), pygame.SRCALPHA)
+        surface.fill((0, 0, 0, 170))
+
+        # Frame time graph, the line marks the 60 FPS budget
+        totals = self.frame_totals()[-width:]
+        scale = graph_height / (budget_ms * 2)
+        for x, total in enumerate(totals):
+            height = min(graph_height, int(total * scale))
+            color = (90, 220, 90) if total <= budget_ms else (230, 80, 60)
+            surface.fill(color, (x, graph_height - height, 1, height))
+        budget_y = graph_height - int(budget_ms * scale)
+        surface.fill((255, 255, 255), (0, budget_y, width, 1))
+
+        y = graph_height + 10
+        surface.blit(text_cache.render("phase           p50 ms   p99 ms", 16), (10, y))
+        for phase, (p50, p99) in self.percentiles().items():
+            y += line_height
+            surface.blit(text_cache.render(f"{phase:<15} {p50:7.3f}  {p99:7.3f}", 16), (10, y))
+        return surface
@@ -0,0 +1,172 @@
+import weakref
+
+import pygame
+
+"""
+Logical render target with a configurable internal resolution.
+All drawing code keeps using the logical 1400x850 coordinates. When the internal
+resolution is lower, blits go to a smaller surface with scaled copies of the images,
+and the result is scaled up to the window once per frame in present().
+QualityController lowers or raises the internal resolution, and turns optional effects
+off or on, to keep frames within budget.
+"""
+
+
+class RenderTarget:
+    def __init__(self, display, logical_size, scale=1.0, smooth=False):
+        self.display = display
+        self.logical_size = logical_size
+        self.scaled_images = weakref.WeakKeyDictionary()  # Source surface -> scaled copy
+        self.smooth = smooth  # Smooth filtering when scaling, looks nicer but costs a lot more
+        self.set_scale(scale)
+
+    def set_scale(self, scale):
+        """Change the internal resolution to scale times the logical size."""
+        self.scale = scale
+        self.scaled_images.clear()
+        if scale == 1 and self.display.get_size() == self.logical_size:
+            # Draw straight into the window, nothing to scale
+            self.surface = self.display
+        else:
+            size = (round(self.logical_size[0] * scale), round(self.logical_size[1] * scale))
+            self.surface = pygame.Surface(size).convert()
+
+    def scaled(self, source):
+        """Return source scaled to the internal resolution, scaling it only once."""
+        image = self.scaled_images.get(source)
+        if image is None:
+            size = (max(1, round(source.get_width() * self.scale)), max(1, round(source.get_height() * self.scale)))
+            image = pygame.transform.smoothscale(source, size) if self.smooth else pygame.transform.scale(source, size)
+            self.scaled_images[source] = image
+        return image
+
+    def to_internal(self, rect):
+        rect = pygame.Rect(rect)
+        scale = self.scale
+        return pygame.Rect(round(rect.x * scale), round(rect.y * scale), round(rect.w * scale), round(rect.h * scale))
+
+    def to_logical(self, rect):
+        scale = self.scale
+        return pygame.Rect(round(rect.x / scale), round(rect.y / scale), round(rect.w / scale), round(rect.h / scale))
+
+    def blit(self, source, dest, area=None, special_flags=0):
+        if self.scale == 1:
+            return self.surface.blit(source, dest, area, special_flags)
+        if len(dest) == 2:
+            dest = (round(dest[0] * self.scale), round(dest[1] * self.scale))
+        else:
+            dest = self.to_internal(dest)
+        if area is not None:
+            area = self.to_internal(area)
+        return self.to_logical(self.surface.blit(self.scaled(source), dest, area, special_flags))
+
+    def blits(self, blit_sequence, doreturn=1):
+        if self.scale == 1:
+            return self.surface.blits(blit_sequence, doreturn)
+        rects = [self.blit(*item) for item in blit_sequence]
+        return rects if doreturn else None
+
+    def fill(self, color, rect=None):
+        if self.scale == 1 or rect is None:
+            return self.surface.fill(color, rect)
+        return self.to_logical(self.surface.fill(color, self.to_internal(rect)))
+
+    def set_clip(self, rect=None):
+        """Limit drawing to rect, or lift the limit when rect is None."""
+        self.surface.set_clip(rect if self.scale == 1 or rect is None else self.to_internal(rect))
+
+    def get_size(self):
+        return self.logical_size
+
+    def get_width(self):
+        return self.logical_size[0]
+
+    def get_height(self):
+        return self.logical_size[1]
+
+    def get_rect(self, **kwargs):
+        rect = pygame.Rect((0, 0), self.logical_size)
+        for key, value in kwargs.items():
+            setattr(rect, key, value)
+        return rect
+
+    def present(self, rects=None):
+        """Scale the internal surface to the window and show it."""
+        if self.surface is self.display:
+            if rects is None:
+                pygame.display.flip()
+            else:
+                pygame.display.update(rects)
+            return
+        if self.smooth:
+            pygame.transform.smoothscale(self.surface, self.display.get_size(), self.display)
+        else:
+            pygame.transform.scale(self.surface, self.display.get_size(), self.display)
+        pygame.display.flip()
+
+
+class QualityController:
+    # Quality levels from best to cheapest: internal resolution scale and optional effects
+    LEVELS = (
+        {"scale": 1.0, "scrolling_background": True},
+        {"scale": 0.75, "scrolling_background": True},
+        {"scale": 0.5, "scrolling_background": True},
+        {"scale": 0.5, "scrolling_background": False},
+    )
+
+    def __init__(self, target, budget_ms=1000 / 60, enabled=True, settle_frames=60, retry_frames=600):
+        self.target = target
+        self.budget_ms = budget_ms
+        self.enabled = enabled
+        self.settle_frames = settle_frames  # Frames to wait after a change before judging again
+        self.level = 0
+        self.max_scale = target.scale  # Adapting never renders sharper than the configured scale
+        self.effects = {"scrolling_background": True}  # Optional effects the drawing code may skip
+        self.average_ms = 0
+        self.frames = 0
+        self.lowest_level = len(self.LEVELS) - 1  # Cheapest level that actually helped
+        self.retry_frames = retry_frames  # Frames before a drop that did not help may be tried again
+        self.blocked_frames = 0
+        self.previous_average_ms = None  # Frame time before the last drop in quality
+
+    def apply(self, level):
+        self.level = level
+        settings = self.LEVELS[level]
+        self.effects["scrolling_background"] = settings["scrolling_background"]
+        scale = min(settings["scale"], self.max_scale)
+        if scale != self.target.scale:
+            self.target.set_scale(scale)
+        self.frames = 0
+
+    def update(self, frame_ms):
+        """Record the work time of one frame and change quality when needed."""
+        if not self.enabled:
+            return
+        # Exponential moving average smooths out single slow frames
+        self.average_ms += (frame_ms - self.average_ms) * 0.1
+        self.frames += 1
+        if self.blocked_frames:
+            # A drop can fail because of a passing spike, so it gets another chance later
+            self.blocked_frames -= 1
+            if not self.blocked_frames:
+                self.lowest_level = len(self.LEVELS) - 1
+        if self.frames < self.settle_frames:
+            return
+
+        # Scaling up to the window has its own cost, so undo a drop that did not pay off
+        if self.previous_average_ms is not None:
+            if self.average_ms >= self.previous_average_ms:
+                self.lowest_level = self.level - 1
+                self.blocked_frames = self.retry_frames
+                self.previous_average_ms = None
+                self.apply(self.level - 1)
+                return
+            self.previous_average_ms = None
+
+        if self.average_ms > self.budget_ms * 0.9 and self.level < self.lowest_level:
+            self.previous_average_ms = self.average_ms
+            self.apply(self.level + 1)
+        elif self.average_ms < self.budget_ms * 0.5 and self.level > 0:
+            self.lowest_level = len(self.LEVELS) - 1  # The load went down, every level is worth trying again
+            self.blocked_frames = 0
+            self.apply(self.level - 1)
@@ -0,0 +1,145 @@
+import argparse
+import os
+import struct
+import sys
+
+"""
+Compact input replays.
+A replay stores the seed, the game constants and the ticks on which jump was pressed,
+delta encoded as varints, plus the final score and tick so playback can be verified.
+Replays can be watched in the game or played back headless as fast as the CPU allows:
+
+    python replay.py verify replays/*.fbr
+"""
+
+MAGIC = b"FBRP"
+VERSION = 1
+HEADER = struct.Struct("<4sBQddiiIII")  # Magic, version, seed, gravity, jump strength, gap height, pipe speed, score, ticks, jumps
+
+
+def encode_varint(value, out):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varint(data, offset):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+class Replay:
+    def __init__(self, seed, gravity, jump_strength, gap_height, pipe_speed, jump_ticks=None, final_score=0, final_tick=0):
+        self.seed = seed
+        self.gravity = gravity
+        self.jump_strength = jump_strength
+        self.gap_height = gap_height
+        self.pipe_speed = pipe_speed
+        self.jump_ticks = jump_ticks if jump_ticks is not None else []  # Ascending ticks with a jump press
+        self.final_score = final_score
+        self.final_tick = final_tick
+
+    @classmethod
+    def start(cls, simulation):
+        """Begin recording the game the simulation was just reset to."""
+        return cls(simulation.seed, simulation.gravity, simulation.jump_strength, simulation.gap_height, simulation.pipe_speed)
+
+    def record(self, tick, action):
+        if action:
+            self.jump_ticks.append(tick)
+
+    def finish(self, simulation):
+        self.final_score = simulation.score
+        self.final_tick = simulation.tick
+
+    def constants(self):
+        """Keyword arguments that give a Simulation the recorded constants."""
+        return {"gravity": self.gravity, "jump_strength": self.jump_strength,
+                "gap_height": self.gap_height, "pipe_speed": self.pipe_speed}
+
+    def apply_constants(self, simulation):
+        for key, value in self.constants().items():
+            setattr(simulation, key, value)
+
+    def actions(self):
+        """Return the set of ticks on which to jump."""
+        return set(self.jump_ticks)
+
+    def to_bytes(self):
+        out = bytearray(HEADER.pack(MAGIC, VERSION, self.seed, self.gravity, self.jump_strength, self.gap_height,
+                                    self.pipe_speed, self.final_score, self.final_tick, len(self.jump_ticks)))
+        previous = 0
+        for tick in self.jump_ticks:
+            encode_varint(tick - previous, out)
+            previous = tick
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, version, seed, gravity, jump_strength, gap_height, pipe_speed, final_score, final_tick, jumps = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a replay file")
+        offset = HEADER.size
+        jump_ticks = []
+        tick = 0
+        for _ in range(jumps):
+            delta, offset = decode_varint(data, offset)
+            tick += delta
+            jump_ticks.append(tick)
+        return cls(seed, gravity, jump_strength, gap_height, pipe_speed, jump_ticks, final_score, final_tick)
+
+    def save(self, path):
+        with open(path, "wb") as file:
+            file.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as file:
+            return cls.from_bytes(file.read())
+
+
+def play_headless(replay, simulation=None):
+    """Play the replay without a window and return (score, ticks)."""
+    if simulation is None:
+        from simulation import Simulation
+        simulation = Simulation.headless(**replay.constants())
+    else:
+        replay.apply_constants(simulation)
+    simulation.reset(replay.seed)
+    actions = replay.actions()
+    while not simulation.done and simulation.tick < replay.final_tick:
+        simulation.step(simulation.tick in actions)
+    return simulation.score, simulation.tick
+
+
+def verify(replay, simulation=None):
+    """Return True when playing the replay reproduces its recorded score and length."""
+    return play_headless(replay, simulation) == (replay.final_score, replay.final_tick)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verify flappy bird replays headless")
+    parser.add_argument("command", choices=["verify"])
+    parser.add_argument("paths", nargs="+")
+    args = parser.parse_args()
+
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    from simulation import Simulation
+
+    simulation = Simulation.headless()
+    failures = 0
+    for path in args.paths:
+        replay = Replay.load(path)
+        score, ticks = play_headless(replay, simulation)
+        ok = (score, ticks) == (replay.final_score, replay.final_tick)
+        failures += not ok
+        print(f"{'OK  ' if ok else 'FAIL'} {path}: recorded {replay.final_score}, replayed {score}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,209 @@
+import multiprocessing
+import os
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+"""
+Rollout farm that runs many headless games across worker processes.
+Observations, actions, rewards and done flags live in shared memory blocks so
+the only thing exchanged per step is one byte each way over a pipe per worker, nothing
+gets pickled. A worker that dies closes its pipe and one that stops answering runs into
+the main process's timeout, so the farm raises instead of hanging.
+"""
+
+OBSERVATION_SIZE = 5  # Length of Simulation.observation()
+
+# Name, dtype and per-game shape of every shared buffer
+BUFFERS = (
+    ("observations", np.float64, (OBSERVATION_SIZE,)),
+    ("actions", np.bool_, ()),
+    ("rewards", np.int64, ()),
+    ("dones", np.bool_, ()),
+    ("episode_scores", np.int64, ()),  # Score of the last finished game in each slot
+)
+
+# Messages over a worker's pipe
+STEP = b"s"
+STOP = b"q"
+READY = b"r"
+
+
+def attach_buffers(names, num_games):
+    """Open the shared memory blocks by name and wrap them in NumPy arrays."""
+    blocks = {}
+    arrays = {}
+    for (key, dtype, shape), name in zip(BUFFERS, names):
+        blocks[key] = shared_memory.SharedMemory(name=name)
+        arrays[key] = np.ndarray((num_games,) + shape, dtype=dtype, buffer=blocks[key].buf)
+    return blocks, arrays
+
+
+def worker(names, num_games, start, stop, seed, connection):
+    """Step the games in slots [start, stop) every time the main process asks for it."""
+    # No window or sound card is needed to simulate
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+    from simulation import build_simulations
+
+    blocks, arrays = attach_buffers(names, num_games)
+    observations = arrays["observations"]
+    actions = arrays["actions"]
+    rewards = arrays["rewards"]
+    dones = arrays["dones"]
+    episode_scores = arrays["episode_scores"]
+
+    # Every slot gets its own simulation and its own sequence of seeds, the images and frames are loaded once
+    games = build_simulations(stop - start)
+    episodes = [0] * len(games)
+
+    def game_seed(slot, episode):
+        return None if seed is None else hash((seed, slot, episode))
+
+    for offset, game in enumerate(games):
+        observations[start + offset] = game.reset(game_seed(start + offset, 0))
+
+    connection.send_bytes(READY)  # Initial observations are ready
+    while True:
+        try:
+            if connection.recv_bytes() != STEP:  # Wait for the actions
+                break
+        except EOFError:
+            break  # The main process is gone
+        for offset, game in enumerate(games):
+            slot = start + offset
+            reward, done = game.step(actions[slot])
+            rewards[slot] = reward
+            dones[slot] = done
+            if done:
+                episode_scores[slot] = game.score
+                episodes[offset] += 1
+                game.reset(game_seed(slot, episodes[offset]))
+            observations[slot] = game.observation()
+        try:
+            connection.send_bytes(READY)  # Results are written
+        except OSError:
+            break  # The main process gave up on the farm
+
+    for block in blocks.values():
+        block.close()
+
+
+class RolloutFarm:
+    def __init__(self, num_games, num_workers=None, seed=None, timeout=60.0):
+        self.num_games = num_games
+        self.num_workers = min(num_workers or os.cpu_count() or 1, num_games)
+        self.timeout = timeout  # Longest wait for the workers, in seconds, before giving up on them
+        self.closed = False
+
+        # Create one shared block per buffer
+        self.blocks = {}
+        self.arrays = {}
+        for key, dtype, shape in BUFFERS:
+            size = max(1, int(np.prod((num_games,) + shape)) * np.dtype(dtype).itemsize)
+            self.blocks[key] = shared_memory.SharedMemory(create=True, size=size)
+            self.arrays[key] = np.ndarray((num_games,) + shape, dtype=dtype, buffer=self.blocks[key].buf)
+            self.arrays[key][...] = 0
+        names = [self.blocks[key].name for key, _, _ in BUFFERS]
+
+        # Shard the games over the workers as evenly as possible
+        context = multiprocessing.get_context()
+        self.processes = []
+        self.connections = []
+        bounds = np.linspace(0, num_games, self.num_workers + 1).astype(int)
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            connection, worker_connection = context.Pipe()
+            process = context.Process(target=worker, args=(names, num_games, start, stop, seed, worker_connection), daemon=True)
+            process.start()
+            worker_connection.close()  # Only the worker holds its end, so its death reads as EOF here
+            self.processes.append(process)
+            self.connections.append(connection)
+
+        self.wait("starting")  # Wait for the initial observations
+
+    @property
+    def observations(self):
+        return self.arrays["observations"]
+
+    @property
+    def rewards(self):
+        return self.arrays["rewards"]
+
+    @property
+    def dones(self):
+        return self.arrays["dones"]
+
+    @property
+    def episode_scores(self):
+        return self.arrays["episode_scores"]
+
+    def step(self, actions):
+        """Step every game once. Returns views of (observations, rewards, dones) in shared memory."""
+        if self.closed:
+            raise RuntimeError("The rollout farm is closed")
+        self.arrays["actions"][:] = actions
+        self.send(STEP, "stepping")  # Hand the actions to the workers
+        self.wait("stepping")  # Wait for them to finish
+        return self.observations, self.rewards, self.dones
+
+    def send(self, message, stage):
+        for connection in self.connections:
+            try:
+                connection.send_bytes(message)
+            except OSError:
+                self.fail(stage)
+
+    def wait(self, stage):
+        """Wait until every worker is ready, or shut the farm down and raise RuntimeError."""
+        deadline = time.monotonic() + self.timeout
+        for connection in self.connections:
+            try:
+                if not connection.poll(max(0, deadline - time.monotonic())):
+                    self.shutdown()
+                    raise RuntimeError(f"Rollout workers did not respond within {self.timeout} s while {stage}")
+                connection.recv_bytes()
+            except (EOFError, OSError):
+                self.fail(stage)
+
+    def fail(self, stage):
+        self.shutdown()  # Healthy workers stop cleanly, so only the dead ones have an exit code
+        failed = [process for process in self.processes if process.exitcode]
+        codes = ", ".join(f"pid {process.pid} exit code {process.exitcode}" for process in failed)
+        raise RuntimeError(f"Rollout worker died while {stage} ({codes or 'no exit code'})") from None
+
+    def shutdown(self):
+        """Stop the workers however they are doing and free the shared memory."""
+        self.closed = True
+        for connection in self.connections:
+            try:
+                connection.send_bytes(STOP)
+            except OSError:
+                pass  # This worker is gone already
+            connection.close()
+        for process in self.processes:
+            process.join(self.timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join(1)
+            if process.is_alive():
+                process.kill()  # A stopped or stuck worker ignores terminate()
+                process.join()
+        self.release()
+
+    def close(self):
+        if not self.closed:
+            self.shutdown()
+
+    def release(self):
+        self.arrays = {}
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.blocks = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
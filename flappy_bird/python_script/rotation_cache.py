@@ -0,0 +1,35 @@
+import pygame
+
+"""
+Cache of pre-rotated sprite frames.
+Every reachable angle is rotated once up front, together with its collision mask and
+the offset that keeps the rotated frame centred on the unrotated image, so drawing
+and collision are both dictionary lookups.
+"""
+
+
+class RotationCache:
+    def __init__(self, image, min_angle=-20, max_angle=30, step=2):
+        self.image = image
+        self.min_angle = min_angle
+        self.max_angle = max_angle
+        self.step = step
+        self.frames = {}
+        for angle in range(min_angle, max_angle + 1, step):
+            self.frames[angle] = self.build_frame(angle)
+
+    def build_frame(self, angle):
+        """Rotate the image and return (surface, mask, (offset_x, offset_y))."""
+        rotated = pygame.transform.rotate(self.image, angle)
+        offset = ((self.image.get_width() - rotated.get_width()) // 2,
+                  (self.image.get_height() - rotated.get_height()) // 2)
+        return rotated, pygame.mask.from_surface(rotated), offset
+
+    def key(self, angle):
+        """Return the cached angle closest to angle."""
+        angle = min(max(angle, self.min_angle), self.max_angle)
+        return self.min_angle + round((angle - self.min_angle) / self.step) * self.step
+
+    def frame(self, angle):
+        """Return the cached frame closest to angle."""
+        return self.frames[self.key(angle)]
@@ -0,0 +1,445 @@
+import time
+
+import pygame
+
+from menu_layer import StaticLayer
+from multiplayer import Client
+from replay import Replay
+
+"""
+Screens of the game as scenes.
+FlappyBirdGame.main_loop() owns the only loop: every frame it hands the events to the
+current scene, and a scene moves on by returning the next scene from update(), never by
+calling it. Old scenes are dropped as soon as they are left, so the stack depth and the
+memory in use stay the same however many games are played.
+"""
+
+
+class Scene:
+    idle = False  # Idle scenes sleep until an event arrives instead of redrawing every frame
+
+    def __init__(self, game):
+        self.game = game
+        self.essentials = game.essentials
+
+    def enter(self):
+        """Called when the scene becomes the current one."""
+
+    def update(self, events):
+        """Handle this frame's events and return the scene to show next, or self to stay."""
+        return self
+
+    def draw(self):
+        """Draw the frame. Idle scenes also present it, and only when it changed."""
+
+    def clicked(self, event):
+        """Return True for a left click, after playing the click sound."""
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            self.essentials.audio.play("click")
+            return True
+        return False
+
+
+class TickingScene(Scene):
+    """A scene whose simulation advances in fixed ticks, with rendering at its own rate in between."""
+
+    def start_ticks(self):
+        self.tick_time = 1 / self.essentials.tick_rate
+        self.accumulator = 0
+        self.previous_time = time.perf_counter()
+
+    def run_ticks(self, step):
+        """Call step(tick_end) for every tick that is due. Returns True as soon as step returns True.
+
+        tick_end is the wall time the tick ends at, every tick takes the presses made before it.
+        """
+        # Clamp long stalls so the game does not try to catch up forever
+        now = time.perf_counter()
+        self.accumulator += min(now - self.previous_time, self.essentials.max_frame_time)
+        self.previous_time = now
+
+        tick_end = now - self.accumulator + self.tick_time
+        ticks = 0
+        while self.accumulator >= self.tick_time and ticks < self.essentials.max_catch_up_ticks:
+            done = step(tick_end)
+            tick_end += self.tick_time
+            if self.game.simulation.jumped:
+                self.essentials.audio.play("jump")
+            self.accumulator -= self.tick_time
+            ticks += 1
+            if done:
+                return True
+        if ticks == self.essentials.max_catch_up_ticks:
+            self.accumulator = min(self.accumulator, self.tick_time)  # Too far behind, drop the backlog
+        return False
+
+    def draw(self):
+        # Draw between the last two ticks so motion stays smooth at any frame rate
+        self.game.sync_state(self.accumulator / self.tick_time)
+        self.game.draw(game=True)
+
+
+class HomeScene(Scene):
+    def enter(self):
+        if self.game.home_layer is None:
+            self.game.home_layer = self.game.build_home_layer()
+        self.essentials.audio.start_music()  # Music starts lazily, once there is something on screen
+
+    def update(self, events):
+        for event in events:
+            if self.clicked(event):
+                if self.game.run_button.collidepoint(event.pos):
+                    return CountdownScene(self.game)
+                elif self.game.stats_button.collidepoint(event.pos):
+                    return StatsScene(self.game)
+                elif self.game.delete_stats_button.collidepoint(event.pos):
+                    return DeleteScene(self.game)
+        return self
+
+    def draw(self):
+        # Only the background scrolls, everything else is one pre-composited blit
+        self.game.draw(game=False)
+        self.game.home_layer.draw(self.essentials.screen)
+
+
+class CountdownScene(Scene):
+    seconds = 3
+
+    def __init__(self, game, replay=None):
+        super().__init__(game)
+        self.replay = replay
+
+    def enter(self):
+        if self.replay is not None:
+            # Watch the replay with the constants and course it was recorded with
+            self.replay.apply_constants(self.game.simulation)
+            self.game.reset_game(self.replay.seed)
+        elif self.game.ghosts:
+            # Race the ghosts on their course
+            self.game.ghosts.apply_constants(self.game.simulation)
+            self.game.reset_game(self.game.ghosts.seed)
+        else:
+            self.game.restore_constants()
+            self.game.reset_game()
+        self.started = time.perf_counter()
+
+    def update(self, events):
+        # Keep pumping events while counting down, so the window stays responsive
+        if time.perf_counter() - self.started >= self.seconds:
+            return PlayScene(self.game, self.replay)
+        return self
+
+    def draw(self):
+        remaining = self.seconds - int(time.perf_counter() - self.started)
+        self.essentials.screen.blit(self.essentials.images["background"], (0, 0))
+        self.essentials.screen.blit(self.essentials.images["flappy_bird"], (50, self.essentials.flappy_y))
+        get_ready = self.essentials.text.render(f"Get Ready {remaining}")
+        self.essentials.screen.blit(get_ready, (self.essentials.screen_width // 2 - 150, self.essentials.screen_height // 2 - 100))
+
+
+class PlayScene(TickingScene):
+    """Play a game from the keyboard, or watch a replay when one is given."""
+
+    def __init__(self, game, replay=None):
+        super().__init__(game)
+        self.replay = replay
+
+    def enter(self):
+        if self.replay is not None:
+            self.replay_actions = self.replay.actions()
+        elif self.game.replay_dir:
+            self.game.recording = Replay.start(self.game.simulation)
+
+        self.start_ticks()
+        self.essentials.input.clear()  # Presses from the countdown do not count
+        self.game.run_started = time.perf_counter()
+
+    def update(self, events):
+        if self.run_ticks(self.step):
+            self.game.sync_state()
+            self.game.save_recording()
+            return GameOverScene(self.game, playback=self.replay is not None)
+        return self
+
+    def step(self, tick_end):
+        """Run one tick with the replay's or the keyboard's jump. Returns True when the run is over."""
+        simulation = self.game.simulation
+        if self.replay is not None:
+            jump = simulation.tick in self.replay_actions
+        else:
+            jump = self.essentials.input.jump_due(tick_end)
+            if self.game.recording:
+                self.game.recording.record(simulation.tick, jump)
+        _, done = simulation.step(jump)
+        return done or (self.replay is not None and simulation.tick >= self.replay.final_tick)
+
+
+class RaceScene(TickingScene):
+    """Race other players on a LAN host at address, a (host, port) pair."""
+
+    join_timeout = 10  # Seconds to wait for the host to answer
+
+    def __init__(self, game, address):
+        super().__init__(game)
+        self.address = address
+
+    def enter(self):
+        self.game.restore_constants()  # Until the host sends the race's own
+        self.game.reset_game()
+        self.client = Client(self.address, self.game.simulation, bird_frames=self.game.bird_frames)
+        self.game.rivals = self.client
+        self.started = time.perf_counter()
+        self.last_request = None
+        self.start_ticks()
+
+    def leave(self, scene):
+        self.client.close()
+        self.game.rivals = None
+        return scene
+
+    def update(self, events):
+        client = self.client
+        now = time.perf_counter()
+        client.poll()
+        if client.refused or (client.player_id is None and now - self.started > self.join_timeout):
+            print(f"Could not join the race at {self.address[0]}:{self.address[1]}")
+            return self.leave(HomeScene(self.game))
+        if client.player_id is None and (self.last_request is None or now - self.last_request > 0.25):
+            client.request_join()
+            self.last_request = now
+
+        if not client.started:
+            self.essentials.input.clear()
+            self.previous_time = now
+            self.game.run_started = now
+            return self
+
+        # Same fixed ticks as a local game, every tick is sent to the host
+        self.run_ticks(self.step)
+
+        if client.done:
+            self.game.sync_state()
+            self.game.score = client.score  # The host's score is the one that counts
+            return self.leave(GameOverScene(self.game))
+        return self
+
+    def step(self, tick_end):
+        self.client.tick(self.essentials.input.jump_due(tick_end))
+        return False  # The host decides when the race is over
+
+    def draw(self):
+        super().draw()
+        if not self.client.started:
+            waiting = self.essentials.text.render("Waiting for players")
+            self.essentials.screen.blit(waiting, (self.essentials.screen_width // 2 - 150, self.essentials.screen_height // 2 - 100))
+
+
+class GameOverScene(Scene):
+    idle = True
+
+    def __init__(self, game, playback=False):
+        super().__init__(game)
+        self.playback = playback  # A watched replay, its score was recorded when it was played
+
+    def enter(self):
+        if not self.playback:
+            self.game.record_score()
+        essentials = self.essentials
+        layer = StaticLayer(essentials.screen.get_size(), fill=(0, 0, 0))
+        final_score = essentials.text.render(f"Score: {self.game.score}")
+        game_over = essentials.text.render("Game Over")
+        try_again = essentials.text.render("Home")
+        high_score = essentials.text.render(f"High Score: {self.game.score_log.high_score}")
+        try_again_button = essentials.images["try_again_button"]
+
+        # Calculate positions
+        button_x = essentials.screen_width // 2 - try_again_button.get_width() // 2
+        button_y = essentials.screen_height // 2 + 100
+        text_x = button_x + (try_again_button.get_width() - try_again.get_width()) // 2
+        text_y = button_y + (try_again_button.get_height() - try_again.get_height()) // 2
+
+        # Composite elements and show them once
+        layer.add(final_score, (essentials.screen_width // 2 - 150, essentials.screen_height // 2 - 100))
+        layer.add(game_over, (essentials.screen_width // 2 - 150, essentials.screen_height // 2 - 200))
+        layer.add(high_score, (essentials.screen_width // 2 - 150, essentials.screen_height // 2))
+        layer.add(try_again_button, (button_x, button_y))
+        layer.add(try_again, (text_x, text_y))
+        self.layer = layer
+        self.dirty = True
+
+    def update(self, events):
+        for event in events:
+            if self.clicked(event) and self.essentials.button.collidepoint(event.pos):
+                return HomeScene(self.game)
+        return self
+
+    def draw(self):
+        if self.dirty:
+            self.layer.draw(self.essentials.screen)
+            self.essentials.present()
+            self.dirty = False
+
+
+class DeleteScene(Scene):
+    idle = True
+
+    def enter(self):
+        if self.game.delete_layer is None:
+            self.game.delete_layer = self.game.build_delete_layer()
+        self.dirty = True
+
+    def update(self, events):
+        for event in events:
+            if self.clicked(event):
+                if self.game.confirm_delete_button.collidepoint(event.pos):
+                    # Delete the recorded scores
+                    self.game.score_log.clear()
+                    if self.game.stats_store:
+                        self.game.stats_store.clear()
+                    return HomeScene(self.game)
+                elif self.game.cancel_delete_button.collidepoint(event.pos):
+                    return HomeScene(self.game)
+        return self
+
+    def draw(self):
+        if self.dirty:
+            self.game.delete_layer.draw(self.essentials.screen)
+            self.essentials.present()
+            self.dirty = False
+
+
+class StatsScene(Scene):
+    """Leaderboard of every recorded score, best first.
+
+    Only the rows in view are read from the score log's index and rendered, and rendered
+    rows are dropped once they scroll out of view, so a history of a million games costs
+    the same memory and frame time as one of ten.
+    """
+
+    idle = True
+    row_height = 50
+    scroll_speed = 12  # Fraction of the remaining distance scrolled per second, eased
+
+    def enter(self):
+        essentials = self.essentials
+        self.count = self.game.score_log.count
+        self.view = pygame.Rect(100, 150, 700, 650)  # Where the rows scroll
+        self.rows_per_page = self.view.height // self.row_height
+        self.max_offset = max(0, self.count * self.row_height - self.view.height)
+        self.offset = 0.0  # Scroll position in pixels, eased towards target
+        self.target = 0.0
+        self.rows = {}  # Rank -> rendered row, only for rows in view
+        self.row_font = essentials.text.font(36)
+        self.previous_time = time.perf_counter()
+        self.position = None  # Text and rect of the "rows a-b of n" label
+        self.surface = None  # Render surface the layer was last drawn on
+        self.dirty = True
+
+        # The background, buttons and labels never change
+        self.layer = StaticLayer(essentials.screen.get_size(), fill=(0, 0, 0))
+        button = pygame.transform.smoothscale(essentials.images["try_again_button"], (400, 240))
+        self.return_button = self.layer.add(button, (900, 580))
+        self.layer.add_centered(essentials.text.render("Return"), self.return_button.center)
+        self.layer.add(essentials.text.render("Leaderboard"), (100, 30))
+        if not self.count:
+            self.layer.add(essentials.text.render("No stats available"), (100, 150))
+            self.up_button = self.down_button = pygame.Rect(0, 0, 0, 0)
+            return
+        arrow = pygame.transform.smoothscale(essentials.images["next"], (120, 120))
+        self.up_button = self.layer.add(pygame.transform.rotate(arrow, 90), (1040, 240))
+        self.down_button = self.layer.add(pygame.transform.rotate(arrow, -90), (1040, 400))
+        if self.game.stats_store and self.game.stats_store.run_count():
+            # Summary from the precomputed aggregates, none before the first recorded run
+            percentiles = self.game.stats_store.percentiles((50, 90))
+            summary = f"Best {self.game.stats_store.best()}  Median {percentiles.get(50)}  Top 10% {percentiles.get(90)}"
+            self.layer.add(essentials.text.render(summary, 30), (100, 100))
+
+    def scroll(self, pixels):
+        self.target = min(max(self.target + pixels, 0), self.max_offset)
+
+    def update(self, events):
+        page = self.rows_per_page * self.row_height
+        for event in events:
+            if self.clicked(event):
+                if self.return_button.collidepoint(event.pos):
+                    return HomeScene(self.game)
+                elif self.up_button.collidepoint(event.pos):
+                    self.scroll(-page)
+                elif self.down_button.collidepoint(event.pos):
+                    self.scroll(page)
+            elif event.type == pygame.MOUSEWHEEL:
+                self.scroll(-event.y * 3 * self.row_height)
+            elif event.type == pygame.KEYDOWN:
+                steps = {pygame.K_UP: -self.row_height, pygame.K_DOWN: self.row_height, pygame.K_PAGEUP: -page,
+                         pygame.K_PAGEDOWN: page, pygame.K_HOME: -self.max_offset, pygame.K_END: self.max_offset}
+                if event.key in steps:
+                    self.scroll(steps[event.key])
+
+        # Ease towards the target, then sleep until the next event once there
+        now = time.perf_counter()
+        elapsed = min(now - self.previous_time, 1 / 30)  # Time asleep does not count
+        self.previous_time = now
+        if self.offset != self.target:
+            self.offset += (self.target - self.offset) * min(1.0, elapsed * self.scroll_speed)
+            if abs(self.target - self.offset) < 0.5:
+                self.offset = self.target
+            self.dirty = True
+        self.idle = self.offset == self.target
+        return self
+
+    def row(self, rank, score):
+        surface = pygame.Surface((self.view.width, self.row_height), pygame.SRCALPHA)
+        surface.blit(self.row_font.render(f"#{rank + 1}", True, (255, 255, 255)), (0, 0))
+        score_text = self.row_font.render(str(score), True, (255, 255, 255))
+        surface.blit(score_text, (self.view.width - score_text.get_width(), 0))
+        return surface
+
+    def draw(self):
+        if not self.dirty:
+            return
+        self.dirty = False
+        screen = self.essentials.screen
+
+        # On the first frame, and whenever a quality change swapped in a new blank surface, draw everything
+        full = screen.surface is not self.surface
+        if full:
+            self.surface = screen.surface
+            self.layer.draw(screen)
+            self.position = None
+        if not self.count:
+            self.essentials.present()
+            return
+
+        # Rows in view, read from the index and rendered only when they come into view
+        first = int(self.offset) // self.row_height
+        stop = min(self.count, (int(self.offset) + self.view.height) // self.row_height + 1)
+        for rank in [rank for rank in self.rows if not first <= rank < stop]:
+            del self.rows[rank]
+        missing = [rank for rank in range(first, stop) if rank not in self.rows]
+        if missing:
+            scores = self.game.score_log.ranked(missing[0], missing[-1] + 1)
+            for rank in missing:
+                self.rows[rank] = self.row(rank, scores[rank - missing[0]])
+
+        self.layer.restore(screen, self.view)
+        screen.set_clip(self.view)
+        top = self.view.top - int(self.offset)
+        screen.blits([(self.rows[rank], (self.view.left, top + rank * self.row_height)) for rank in range(first, stop)],
+                     doreturn=False)
+        screen.set_clip(None)
+
+        # Which rows are in view, rendered again only when that changes
+        last = min(self.count, first + self.rows_per_page)
+        text = f"{first + 1}-{last} of {self.count:,}"
+        dirty_rects = [self.view]
+        if self.position is None or self.position[0] != text:
+            if self.position is not None:
+                self.layer.restore(screen, self.position[1])
+                dirty_rects.append(self.position[1])
+            label = self.essentials.text.font(24).render(text, True, (255, 255, 255))
+            self.position = (text, screen.blit(label, label.get_rect(midtop=(1100, 160))))
+            dirty_rects.append(self.position[1])
+        if full:
+            self.essentials.present()
+        elif self.idle:
+            self.essentials.present(dirty_rects)
@@ -0,0 +1,176 @@
+import bisect
+import os
+import struct
+from array import array
+
+"""
+Append-only score history.
+Every finished game appends one 4 byte record to the log, and a small index file keeps
+the record count, the high score and how many games ended on each score, so recording a
+score, reading the high score and reading any window of the history sorted best first
+never scan the log. Log writes are fsynced in batches; the index is a checkpoint written
+with each batch and any records after it are folded in on open.
+"""
+
+LOG_MAGIC = b"FBSCORE1"
+INDEX_MAGIC = b"FBINDEX2"
+RECORD = struct.Struct("<I")
+INDEX_HEADER = struct.Struct("<8sQqI")  # Magic, records covered, high score, number of distinct scores
+SCORE_COUNT = struct.Struct("<IQ")  # Score, games that ended on it
+
+
+class ScoreLog:
+    def __init__(self, path="scores.log", index_path="scores.idx", fsync_every=16, legacy_path="scores.txt"):
+        self.path = path
+        self.index_path = index_path
+        self.fsync_every = fsync_every
+        self.pending = 0  # Records written since the last fsync
+
+        new_log = not os.path.exists(self.path)
+        self.file = open(self.path, "a+b")
+        if new_log or os.path.getsize(self.path) < len(LOG_MAGIC):
+            self.file.truncate(0)
+            self.file.write(LOG_MAGIC)
+            self.file.flush()
+
+        # Drop a partly written record left behind by a crash
+        size = os.path.getsize(self.path)
+        self.count = (size - len(LOG_MAGIC)) // RECORD.size
+        if len(LOG_MAGIC) + self.count * RECORD.size != size:
+            self.file.truncate(len(LOG_MAGIC) + self.count * RECORD.size)
+
+        self.load_index()
+
+        # Bring the scores of the old text file over once
+        if new_log and legacy_path and os.path.exists(legacy_path):
+            self.import_text(legacy_path)
+
+    def load_index(self):
+        self.high_score = None
+        self.counts = {}  # Score -> games that ended on it
+        self.ranks = None  # Scores best first and the rank after each, rebuilt when needed
+        covered = 0
+        try:
+            with open(self.index_path, "rb") as file:
+                data = file.read()
+            magic, covered, high_score, distinct = INDEX_HEADER.unpack_from(data)
+            if magic != INDEX_MAGIC or covered > self.count:
+                raise ValueError("index does not match the log")
+            self.counts = {score: count for score, count in SCORE_COUNT.iter_unpack(
+                data[INDEX_HEADER.size:INDEX_HEADER.size + distinct * SCORE_COUNT.size])}
+            if sum(self.counts.values()) != covered:
+                raise ValueError("index does not match the log")
+            self.high_score = high_score if covered else None
+        except (OSError, struct.error, ValueError):
+            covered = 0
+            self.counts = {}
+
+        # Fold in the records written after the last checkpoint
+        if covered < self.count:
+            for start in range(covered, self.count, 65536):
+                for score in self.read_range(start, start + 65536):
+                    self.index(score)
+            self.write_index()
+
+    def import_text(self, legacy_path):
+        # One write and one fsync for the whole file, append() would sync every fsync_every lines
+        with open(legacy_path, "r") as file:
+            scores = [int(line) for line in map(str.strip, file) if line.isdigit()]
+        self.file.write(b"".join(RECORD.pack(score) for score in scores))
+        self.count += len(scores)
+        for score in scores:
+            self.index(score)
+        self.sync()
+
+    def index(self, score):
+        if self.high_score is None or score > self.high_score:
+            self.high_score = score
+        self.counts[score] = self.counts.get(score, 0) + 1
+        self.ranks = None
+
+    def append(self, score):
+        """Record one score."""
+        self.file.write(RECORD.pack(score))
+        self.file.flush()
+        self.count += 1
+        self.index(score)
+        self.pending += 1
+        if self.pending >= self.fsync_every:
+            self.sync()
+
+    def sync(self):
+        """Force the log to disk and checkpoint the index."""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+        self.write_index()
+
+    def write_index(self):
+        high_score = self.high_score if self.high_score is not None else 0
+        data = INDEX_HEADER.pack(INDEX_MAGIC, self.count, high_score, len(self.counts))
+        data += b"".join(SCORE_COUNT.pack(score, count) for score, count in self.counts.items())
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, self.index_path)
+
+    def top(self, k=10):
+        """Return the k best scores, best first."""
+        return self.ranked(0, k)
+
+    def ranked(self, start, stop):
+        """Return the scores ranked [start, stop) with the best score ranked 0.
+
+        Only the per-score counts are read, so the cost depends on the window and the
+        number of distinct scores, never on the length of the history.
+        """
+        if self.ranks is None:
+            scores = sorted(self.counts, reverse=True)
+            ends = array("q")  # Rank just after the last game on each score
+            total = 0
+            for score in scores:
+                total += self.counts[score]
+                ends.append(total)
+            self.ranks = (scores, ends)
+        scores, ends = self.ranks
+        stop = min(stop, self.count)
+        window = []
+        index = bisect.bisect_right(ends, start)
+        rank = start
+        while rank < stop:
+            take = min(stop, ends[index]) - rank
+            window.extend([scores[index]] * take)
+            rank += take
+            index += 1
+        return window
+
+    def read_range(self, start, stop):
+        """Return the scores of records [start, stop) in the order they were played."""
+        stop = min(stop, self.count)
+        if start >= stop:
+            return []
+        self.file.flush()
+        with open(self.path, "rb") as file:
+            file.seek(len(LOG_MAGIC) + start * RECORD.size)
+            data = file.read((stop - start) * RECORD.size)
+        return [score for (score,) in RECORD.iter_unpack(data)]
+
+    def read_all(self):
+        return self.read_range(0, self.count)
+
+    def clear(self):
+        """Delete every recorded score."""
+        self.file.truncate(len(LOG_MAGIC))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.count = 0
+        self.pending = 0
+        self.high_score = None
+        self.counts = {}
+        self.ranks = None
+        self.write_index()
+
+    def close(self):
+        if self.pending:
+            self.sync()
+        self.file.close()
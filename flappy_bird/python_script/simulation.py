@@ -0,0 +1,292 @@
+import random
+from pathlib import Path
+
+import pygame
+
+from collision import Collider
+from rotation_cache import RotationCache
+
+"""
+Headless simulation core for the flappy bird game.
+It holds the game rules (physics, pipes, collisions, scoring) without any window,
+clock or wall-clock timing so it can be stepped as fast as the CPU allows.
+"""
+
+# Default location of the images when running from source
+IMAGES_DIR = Path(__file__).resolve().parent.parent / "images"
+
+
+class PipeImages:
+    """The pipe image, its flipped copy and both masks, built once and shared by every pipe."""
+
+    def __init__(self, image, mask=None):
+        self.image = image
+        self.flipped = pygame.transform.flip(image, False, True)
+        self.width = image.get_width()
+        self.height = image.get_height()
+
+        # Create masks for collision detection
+        self.mask_top = pygame.mask.from_surface(self.flipped)
+        self.mask_bottom = mask if mask is not None else pygame.mask.from_surface(image)
+
+
+class Pipe:
+    __slots__ = ("images", "x", "previous_x", "gap_height", "top_height", "bottom_y")
+
+    def __init__(self, images, x, gap_height, rng=random):
+        self.images = images
+        self.place(x, gap_height, rng)
+
+    def place(self, x, gap_height, rng=random):
+        """Put the pipe at x with a new random gap, so a pooled pipe can be reused."""
+        self.x = x
+        self.previous_x = x  # Position before the last tick, for render interpolation
+        self.gap_height = gap_height
+        self.top_height = rng.randint(150, 450)  # Random height for the top pipe
+
+        # Bottom pipe's position is below the gap
+        self.bottom_y = self.top_height + self.gap_height
+
+    def draw(self, screen, alpha=1.0):
+        # Interpolate between the last two ticks, alpha is how far into the next tick we are
+        x = self.previous_x + (self.x - self.previous_x) * alpha
+
+        # Draw the top pipe (flipped vertically)
+        screen.blit(self.images.flipped, (x, self.top_height - self.images.height))
+
+        # Draw the bottom pipe
+        screen.blit(self.images.image, (x, self.bottom_y))
+
+    def update(self, speed):
+        self.previous_x = self.x
+        self.x -= speed
+
+    def is_off_screen(self):
+        return self.x + self.images.width < 0
+
+    def get_masks(self):
+        top_pipe_pos = (self.x, self.top_height - self.images.height)
+        bottom_pipe_pos = (self.x, self.bottom_y)
+        return (self.images.mask_top, top_pipe_pos), (self.images.mask_bottom, bottom_pipe_pos)
+
+
+class PipePool:
+    """Free list of pipes, so pipes are recycled instead of allocated while playing."""
+
+    def __init__(self, images):
+        self.images = images
+        self.free = []
+
+    def acquire(self, x, gap_height, rng=random):
+        if self.free:
+            pipe = self.free.pop()
+            pipe.place(x, gap_height, rng)
+            return pipe
+        return Pipe(self.images, x, gap_height, rng)
+
+    def release(self, pipe):
+        self.free.append(pipe)
+
+
+def load_headless_images(images_dir=IMAGES_DIR):
+    """Load the bird and pipe images without opening a window."""
+    images_dir = Path(images_dir)
+    bird_image = pygame.transform.scale(pygame.image.load(images_dir / "flappy_bird.png"), (160, 120))
+    pipe_image = pygame.transform.scale(pygame.image.load(images_dir / "pipes.png"), (150, 800))
+    return bird_image, pipe_image
+
+
+class Simulation:
+    def __init__(self, bird_image, pipe_image, screen_width=1400, screen_height=850,
+                 gravity=0.4, jump_strength=-9, gap_height=250, pipe_speed=5, bird_frames=None, pipe_mask=None):
+        self.bird_image = bird_image
+        self.pipe_image = pipe_image
+        self.screen_width = screen_width
+        self.screen_height = screen_height
+
+        # Game constants
+        self.gravity = gravity  # Gravity value for smooth fall
+        self.jump_strength = jump_strength  # Strength of the jump
+        self.gap_height = gap_height  # Gap between top and bottom pipes
+        self.pipe_speed = pipe_speed  # Speed at which pipes move left
+        self.pipe_interval = 90  # Ticks between pipe generations (1.5 seconds at 60 ticks per second)
+        self.jump_cooldown_ticks = 10  # Ticks before the bird can jump again
+        self.bird_x = 50
+        self.padding = 20  # Padding to avoid immediate game over when near edges
+        self.max_up_angle = 30  # Maximum upward tilt angle
+        self.max_down_angle = -20  # Maximum downward tilt angle
+        self.rotation_speed = 2  # Speed at which the bird rotates
+
+        # Rotated bird frames and masks, unless they were built already
+        if bird_frames is None:
+            bird_frames = RotationCache(self.bird_image, self.max_down_angle, self.max_up_angle, self.rotation_speed)
+        self.bird_frames = bird_frames
+
+        # Pipe surfaces and masks are shared, pipes themselves are pooled
+        self.pipe_images = PipeImages(self.pipe_image, pipe_mask)
+        self.pipe_pool = PipePool(self.pipe_images)
+        self.pipes = []
+        self.collider = Collider(self.bird_frames, self.pipe_images)
+
+        self.profiler = None  # Optional FrameProfiler, told when each phase of a tick ends
+
+        self.reset()
+
+    @classmethod
+    def headless(cls, images_dir=IMAGES_DIR, **kwargs):
+        """Build a simulation from the image files, without a display."""
+        bird_image, pipe_image = load_headless_images(images_dir)
+        return cls(bird_image, pipe_image, **kwargs)
+
+    def reset(self, seed=None):
+        """Start a new game. The same seed always produces the same pipe course."""
+        self.seed = seed
+        self.rng = random.Random(seed)
+
+        # Hand the pipes back to the pool, keeping the same list object
+        for pipe in self.pipes:
+            self.pipe_pool.release(pipe)
+        self.pipes.clear()
+
+        self.flappy_y = self.screen_height // 2
+        self.flappy_velocity = 0
+        self.flappy_angle = 0
+        self.previous_flappy_y = self.flappy_y
+        self.previous_flappy_angle = self.flappy_angle
+        self.jump_cooldown = 0
+        self.score = 0
+        self.tick = 0
+        self.last_pipe_tick = -self.pipe_interval  # Spawn the first pipe straight away
+        self.jumped = False
+        self.done = False
+        self.death_cause = None  # "floor", "ceiling" or "pipe" once the game is over
+        self.pass_ticks = []  # Tick on which each pipe was passed
+        return self.observation()
+
+    def step(self, action):
+        """Advance the game by one tick. action is True to jump. Returns (reward, done)."""
+        if self.done:
+            return 0, True
+
+        profiler = self.profiler
+        score_before = self.score
+        self.previous_flappy_y = self.flappy_y  # State before this tick, for render interpolation
+        self.previous_flappy_angle = self.flappy_angle
+        self.jumped = False
+        if action:
+            self.jump()
+
+        # Generate new pipes at regular intervals
+        if self.tick - self.last_pipe_tick >= self.pipe_interval:
+            self.generate_pipe()
+            self.last_pipe_tick = self.tick
+        if profiler is not None:
+            profiler.mark("pipe generation")
+
+        self.apply_physics()
+        if profiler is not None:
+            profiler.mark("physics")
+        self.update_pipes()
+        if profiler is not None:
+            profiler.mark("update pipes")
+        if not self.done:
+            self.check_collisions()
+        if profiler is not None:
+            profiler.mark("collision")
+
+        self.tick += 1
+        return self.score - score_before, self.done
+
+    def jump(self):
+        if self.jump_cooldown <= 0:
+            self.flappy_velocity = self.jump_strength
+            self.jump_cooldown = self.jump_cooldown_ticks  # Reset cooldown
+            self.jumped = True
+
+    def generate_pipe(self):
+        self.pipes.append(self.pipe_pool.acquire(self.screen_width, self.gap_height, self.rng))
+
+    def update_pipes(self):
+        # Move the pipes and return the ones that are off the screen to the pool, in place
+        kept = 0
+        for pipe in self.pipes:
+            pipe.update(self.pipe_speed)
+            if pipe.is_off_screen():
+                self.pipe_pool.release(pipe)
+            else:
+                self.pipes[kept] = pipe
+                kept += 1
+        del self.pipes[kept:]
+
+    def apply_physics(self):
+        # Apply gravity
+        self.flappy_velocity += self.gravity
+
+        # Update the bird's position
+        self.flappy_y += self.flappy_velocity
+
+        if self.flappy_velocity < 0:  # Bird is going up
+            target_angle = self.max_up_angle
+        else:  # Bird is going down
+            target_angle = self.max_down_angle
+
+        # Smoothly interpolate the current angle towards the target angle
+        if self.flappy_angle > target_angle:
+            self.flappy_angle = max(self.flappy_angle - self.rotation_speed, target_angle)
+        elif self.flappy_angle < target_angle:
+            self.flappy_angle = min(self.flappy_angle + self.rotation_speed, target_angle)
+
+        # Prevent the bird from going off the screen with padding
+        if self.flappy_y > self.screen_height - self.padding:
+            self.done = True
+            self.death_cause = "floor"
+        elif self.flappy_y < self.padding:
+            self.done = True
+            self.death_cause = "ceiling"
+
+        # Decrease jump cooldown timer
+        if self.jump_cooldown > 0:
+            self.jump_cooldown -= 1
+
+    def check_collisions(self):
+        # Collide with the rotated frame the player sees
+        bird = self.collider.bird(self.bird_x, self.flappy_y, self.flappy_angle)
+        for pipe in self.pipes:
+            if self.collider.hits(bird, pipe):
+                self.done = True
+                self.death_cause = "pipe"
+                break  # End the game immediately if a collision is detected
+            if pipe.previous_x > self.bird_x >= pipe.x:
+                # The pipe crossed the bird's x position this tick, the bird has passed it
+                self.score += 1
+                self.pass_ticks.append(self.tick)
+
+    def next_pipe(self):
+        """Return the first pipe that the bird has not passed yet, or None."""
+        for pipe in self.pipes:
+            if pipe.x + pipe.images.width >= self.bird_x:
+                return pipe
+        return None
+
+    def observation(self):
+        """Return a small tuple describing the state, for bots and agents."""
+        pipe = self.next_pipe()
+        if pipe is None:
+            return (self.flappy_y, self.flappy_velocity, self.screen_width - self.bird_x, 0, self.screen_height)
+        return (self.flappy_y, self.flappy_velocity, pipe.x - self.bird_x, pipe.top_height, pipe.bottom_y)
+
+    def run_headless(self, policy, seed=None, max_ticks=100000):
+        """Play one game with policy(observation) -> bool and return the final score."""
+        observation = self.reset(seed)
+        while not self.done and self.tick < max_ticks:
+            self.step(policy(observation))
+            observation = self.observation()
+        return self.score
+
+
+def build_simulations(count, images_dir=IMAGES_DIR, **kwargs):
+    """Build count headless simulations that share their images, masks and rotated frames."""
+    first = Simulation.headless(images_dir, **kwargs)
+    others = [Simulation(first.bird_image, first.pipe_image, bird_frames=first.bird_frames,
+                         pipe_mask=first.pipe_images.mask_bottom, **kwargs) for _ in range(count - 1)]
+    return [first] + others
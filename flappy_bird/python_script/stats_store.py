@@ -0,0 +1,160 @@
+import queue
+import sqlite3
+import threading
+import time
+
+"""
+Optional SQLite stats backend.
+Every finished run is recorded with its score, duration, pipes passed, cause of death
+and seed. Writes are queued and committed in batches by a background thread, so the
+game never waits on the disk. The same transactions keep a score histogram and daily
+rollups up to date, so the stats screen never has to scan every run.
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    played_at REAL NOT NULL,
+    score INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    ticks INTEGER NOT NULL,
+    pipes_passed INTEGER NOT NULL,
+    cause TEXT,
+    seed INTEGER
+);
+CREATE TABLE IF NOT EXISTS score_histogram (
+    score INTEGER PRIMARY KEY,
+    runs INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS daily_rollups (
+    day TEXT PRIMARY KEY,
+    runs INTEGER NOT NULL,
+    total_score INTEGER NOT NULL,
+    best INTEGER NOT NULL,
+    total_duration REAL NOT NULL
+);
+"""
+
+CLEAR = object()  # Queue command that deletes every run
+STOP = object()  # Queue command that stops the writer
+
+
+class StatsStore:
+    def __init__(self, path="stats.db", batch_size=64, flush_interval=1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval  # Longest time a run waits in the queue
+        self.queue = queue.Queue()
+
+        # Create the tables before anyone reads
+        connection = self.connect()
+        connection.executescript(SCHEMA)
+        connection.close()
+
+        self.reader = self.connect()
+        self.writer_thread = threading.Thread(target=self.writer, daemon=True)
+        self.writer_thread.start()
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def record_run(self, score, duration, ticks, pipes_passed, cause, seed):
+        """Queue one finished run. Returns straight away."""
+        self.queue.put((time.time(), score, duration, ticks, pipes_passed, cause, seed))
+
+    def clear(self):
+        """Queue the deletion of every run, after the runs queued before it."""
+        self.queue.put(CLEAR)
+
+    def writer(self):
+        connection = self.connect()
+        running = True
+        while running:
+            item = self.queue.get()
+
+            # Gather whatever else arrives shortly after, up to one batch
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not STOP:
+                try:
+                    batch.append(self.queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+
+            with connection:
+                for item in batch:
+                    if item is STOP:
+                        running = False
+                    elif item is CLEAR:
+                        connection.execute("DELETE FROM runs")
+                        connection.execute("DELETE FROM score_histogram")
+                        connection.execute("DELETE FROM daily_rollups")
+                    else:
+                        self.write_run(connection, item)
+            for _ in batch:
+                self.queue.task_done()
+        connection.close()
+
+    def write_run(self, connection, run):
+        played_at, score, duration, ticks, pipes_passed, cause, seed = run
+        connection.execute(
+            "INSERT INTO runs (played_at, score, duration, ticks, pipes_passed, cause, seed) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            run)
+        connection.execute(
+            "INSERT INTO score_histogram (score, runs) VALUES (?, 1) "
+            "ON CONFLICT(score) DO UPDATE SET runs = runs + 1",
+            (score,))
+        day = time.strftime("%Y-%m-%d", time.localtime(played_at))
+        connection.execute(
+            "INSERT INTO daily_rollups (day, runs, total_score, best, total_duration) VALUES (?, 1, ?, ?, ?) "
+            "ON CONFLICT(day) DO UPDATE SET runs = runs + 1, total_score = total_score + excluded.total_score, "
+            "best = MAX(best, excluded.best), total_duration = total_duration + excluded.total_duration",
+            (day, score, score, duration))
+
+    def flush(self):
+        """Wait until every queued run is written."""
+        self.queue.join()
+
+    def best(self):
+        row = self.reader.execute("SELECT MAX(score) FROM score_histogram").fetchone()
+        return row[0]
+
+    def run_count(self):
+        row = self.reader.execute("SELECT COALESCE(SUM(runs), 0) FROM score_histogram").fetchone()
+        return row[0]
+
+    def histogram(self):
+        """Return [(score, runs)] ordered by score."""
+        return self.reader.execute("SELECT score, runs FROM score_histogram ORDER BY score").fetchall()
+
+    def percentiles(self, percents=(50, 90, 99)):
+        """Return {percent: score} computed from the histogram."""
+        histogram = self.histogram()
+        total = sum(runs for _, runs in histogram)
+        result = {}
+        if not total:
+            return result
+        for percent in percents:
+            target = percent / 100 * total
+            seen = 0
+            for score, runs in histogram:
+                seen += runs
+                if seen >= target:
+                    result[percent] = score
+                    break
+        return result
+
+    def daily(self, days=30):
+        """Return [(day, runs, average score, best, total duration)], newest first."""
+        return self.reader.execute(
+            "SELECT day, runs, CAST(total_score AS REAL) / runs, best, total_duration "
+            "FROM daily_rollups ORDER BY day DESC LIMIT ?",
+            (days,)).fetchall()
+
+    def close(self):
+        self.queue.put(STOP)
+        self.writer_thread.join()
+        self.reader.close()
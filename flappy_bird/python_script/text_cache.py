@@ -0,0 +1,64 @@
+from collections import OrderedDict
+
+import pygame
+
+"""
+Caches for rendered text.
+TextCache keeps a bounded LRU of rendered surfaces so static labels are only rendered
+once, and NumberRenderer builds numbers like "Score: 12" from pre-rendered digit glyphs
+instead of running the font renderer every frame.
+"""
+
+WHITE = (255, 255, 255)
+
+
+class TextCache:
+    def __init__(self, font_path, max_entries=256):
+        self.font_path = font_path
+        self.max_entries = max_entries
+        self.fonts = {}
+        self.surfaces = OrderedDict()
+
+    def font(self, size):
+        """Return the font at size, loading it from disk only the first time."""
+        if size not in self.fonts:
+            self.fonts[size] = pygame.font.Font(self.font_path, size)
+        return self.fonts[size]
+
+    def render(self, text, size=50, color=WHITE):
+        """Return the rendered text, from the cache when possible."""
+        key = (self.font_path, size, text, color)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            return surface
+
+        surface = self.font(size).render(text, True, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_entries:
+            self.surfaces.popitem(last=False)  # Evict the least recently used text
+        return surface
+
+
+class NumberRenderer:
+    def __init__(self, text_cache, prefix="", size=50, color=WHITE):
+        self.prefix = text_cache.render(prefix, size, color) if prefix else None
+        self.prefix_width = self.prefix.get_width() if self.prefix else 0
+
+        # Atlas of the ten digit glyphs
+        self.digits = [text_cache.render(str(digit), size, color) for digit in range(10)]
+        self.blit_list = []
+
+    def draw(self, screen, position, value):
+        """Blit the prefix followed by value at position and return the covered rect."""
+        x, y = position
+        self.blit_list.clear()
+        if self.prefix:
+            self.blit_list.append((self.prefix, (x, y)))
+            x += self.prefix_width
+        for char in str(value):
+            glyph = self.digits[int(char)]
+            self.blit_list.append((glyph, (x, y)))
+            x += glyph.get_width()
+        rects = screen.blits(self.blit_list)
+        return rects[0].unionall(rects[1:]) if rects else pygame.Rect(position, (0, 0))
@@ -10,6 +10,9 @@ setup(
     install_requires=[
         'pygame',
     ],
+    extras_require={
+        'batch': ['numpy'],
+    },
     classifiers=[
         'Programming Language :: Python :: 3',
         'Programming Language :: Python :: 3.11',